@@ -0,0 +1,845 @@
+#!/usr/bin/python3
+
+# Offline benchmark for the submission statement bot
+# Drives Janitor.update_submission_list and Janitor.handle_posts against a fake, in-process stand-in for praw.Reddit, so the bot's hot paths can be
+# measured (and compared between versions) without pointing it at the live site or needing a network connection.
+#
+# For each cycle it reports:
+#   - the API calls the bot made, split by type (listings, /api/info, mod log reads, comment fetches, "more comments" expansions, writes)
+#   - the wall time of the cycle
+#   - time-to-enforcement: how long after a post's deadline the removal/report/validation actually landed (in simulated time)
+#   - peak memory allocated by the bot's own code
+#
+# Usage:
+#   python3 submission-statement-bot-benchmark.py                         # default synthetic scenario
+#   python3 submission-statement-bot-benchmark.py --posts-per-cycle 50 --burst-size 500 --comments-per-post 300
+#   python3 submission-statement-bot-benchmark.py --save scenario.json    # write the generated scenario out so it can be replayed exactly
+#   python3 submission-statement-bot-benchmark.py --replay scenario.json  # run a saved (or recorded) scenario
+#
+# Time is simulated: the bot's clock is swapped for one that moves on between cycles by however long the bot asks to wait (bot_interval, or the
+# adaptive wait with adaptive_polling), so a run covering hours of posting takes seconds.
+
+from configparser import ConfigParser, ExtendedInterpolation
+from contextlib import redirect_stdout
+from datetime import datetime
+import argparse
+import importlib.util
+import io
+import json
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "submission-statement-bot.py")
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "submission-statement-bot.cfg.example")
+START_TIME = 1700000000.0 # Fixed start point for the simulated clock, so that runs are reproducible
+
+
+###############################################################################
+###
+### Simulated clock -- replaces datetime/time inside the bot module
+###
+###############################################################################
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def clock_datetime(clock):
+    # A datetime class whose now() reads the simulated clock. Everything else behaves as normal.
+    class ClockDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(clock.now, tz)
+    return ClockDatetime
+
+
+class TooManyRequests(Exception):
+    # What Reddit answers with (HTTP 429) once the rate limit has been used up
+    pass
+
+
+class ClockTime:
+    # Stands in for the time module: time() and sleep() use the simulated clock, anything else is passed through
+    def __init__(self, clock):
+        self.clock = clock
+
+    def time(self):
+        return self.clock.now
+
+    def sleep(self, seconds):
+        self.clock.advance(seconds)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+###############################################################################
+###
+### Fake Reddit -- just enough of PRAW's interface for the bot
+### Records (PostRecord/CommentRecord) hold the "server side" state. The objects handed to the bot are views onto them, created fresh
+### each time they're fetched, in the same way PRAW creates new objects for each response.
+###
+###############################################################################
+
+COMMENTS_PER_FETCH = 200 # Top level comments returned with a post before the rest are left behind "more comments"
+COMMENTS_PER_MORE = 100  # Comments loaded by each "more comments" request
+RATE_LIMIT = 1000        # Requests allowed per rate limit window
+RATE_LIMIT_WINDOW = 600  # Seconds
+
+
+class Redditor:
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return other is not None and self.name.lower() == getattr(other, "name", other).lower()
+
+    def __hash__(self):
+        return hash(self.name.lower())
+
+    def __str__(self):
+        return self.name
+
+
+class CommentRecord:
+    def __init__(self, world, comment_id, post, parent, author, body, created_utc):
+        self.world = world
+        self.id = comment_id
+        self.post = post
+        self.parent = parent # None for a top level comment
+        self.author = author
+        self.body = body
+        self.created_utc = created_utc
+        self.replies = []
+        self.distinguished = None
+        self.stickied = False
+        self.locked = False
+        self.removed = False
+        self.deleted = False
+
+
+class PostRecord:
+    def __init__(self, world, post_id, subreddit, author, title, created_utc, distinguished=None):
+        self.world = world
+        self.id = post_id
+        self.subreddit = subreddit
+        self.author = author
+        self.title = title
+        self.created_utc = created_utc
+        self.distinguished = distinguished
+        self.comments = []
+        self.removed = False
+        self.reported = False
+        self.approved = False
+        self.deleted = False
+        self.enforced_at = None # Simulated time of the first enforcement action, for time-to-enforcement
+        self.mod_note = None # Why the bot removed or reported the post
+        self.spam = False # Part of the scenario's spam ring (see generate_scenario)
+
+
+class CommentForest:
+    def __init__(self, comments, hidden=()):
+        self._comments = list(comments)
+        self._hidden = list(hidden) # Comments sitting behind "more comments"
+
+    def __iter__(self):
+        return iter(self._comments)
+
+    def __len__(self):
+        return len(self._comments)
+
+    def replace_more(self, limit=32):
+        if len(self._hidden) == 0:
+            return []
+        if limit == 0:
+            self._hidden = []
+            return []
+        requests = math.ceil(len(self._hidden) / COMMENTS_PER_MORE)
+        if limit is not None:
+            requests = min(requests, limit)
+        loaded = self._hidden[:requests * COMMENTS_PER_MORE]
+        self._hidden = self._hidden[requests * COMMENTS_PER_MORE:]
+        self._comments.extend(loaded)
+        if len(loaded) > 0:
+            loaded[0]._record.world.count("more", requests)
+        return []
+
+    def list(self):
+        flattened = []
+        queue = list(self._comments)
+        while len(queue) > 0:
+            comment = queue.pop(0)
+            flattened.append(comment)
+            queue.extend(comment.replies)
+        return flattened
+
+
+class CommentModeration:
+    def __init__(self, comment):
+        self.comment = comment
+
+    def distinguish(self, how="yes", sticky=False):
+        record = self.comment._load()
+        record.world.count("write")
+        record.distinguished = "moderator"
+        record.stickied = sticky
+
+    def lock(self):
+        record = self.comment._load()
+        record.world.count("write")
+        record.locked = True
+        record.world.enforced(record.post)
+
+    def remove(self, spam=False, mod_note=None):
+        record = self.comment._load()
+        record.world.count("write")
+        record.removed = True
+        record.world.log_action("removecomment", "t1_" + record.id, record.world.bot)
+
+
+class Comment:
+    def __init__(self, world, comment_id, record=None):
+        self._world = world
+        self.id = comment_id
+        self._record = record
+        self.mod = CommentModeration(self)
+
+    def _load(self):
+        if self._record is None:
+            self._record = self._world.comments[self.id]
+        return self._record
+
+    @property
+    def fullname(self):
+        return "t1_" + self.id
+
+    @property
+    def parent_id(self):
+        record = self._load()
+        return ("t1_" + record.parent.id) if record.parent is not None else ("t3_" + record.post.id)
+
+    @property
+    def link_id(self):
+        return "t3_" + self._load().post.id
+
+    @property
+    def author(self):
+        record = self._load()
+        return None if record.deleted else record.author
+
+    @property
+    def body(self):
+        record = self._load()
+        if record.deleted:
+            return "[deleted]"
+        if record.removed:
+            return "[removed]"
+        return record.body
+
+    @property
+    def is_submitter(self):
+        record = self._load()
+        return record.author == record.post.author
+
+    @property
+    def edited(self):
+        return False
+
+    @property
+    def stickied(self):
+        return self._load().stickied
+
+    @property
+    def replies(self):
+        return CommentForest(Comment(self._world, reply.id, reply) for reply in self._load().replies if not reply.deleted)
+
+    def delete(self):
+        record = self._load()
+        self._world.count("write")
+        record.deleted = True
+
+    def edit(self, body):
+        record = self._load()
+        self._world.count("write")
+        record.body = body
+        return self
+
+    def __eq__(self, other):
+        return isinstance(other, Comment) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class SubmissionModeration:
+    def __init__(self, submission):
+        self.submission = submission
+
+    def remove(self, spam=False, mod_note=None, reason_id=None):
+        record = self.submission._record
+        record.world.count("write")
+        record.removed = True
+        record.mod_note = mod_note
+        record.world.enforced(record)
+        record.world.log_action("removelink", "t3_" + record.id, record.world.bot)
+
+    def approve(self):
+        record = self.submission._record
+        record.world.count("write")
+        record.approved = True
+        record.removed = False
+        record.world.log_action("approvelink", "t3_" + record.id, record.world.bot)
+
+
+class SubredditName:
+    def __init__(self, display_name):
+        self.display_name = display_name
+
+
+class Submission:
+    def __init__(self, world, record):
+        self._world = world
+        self._reddit = world.reddit
+        self._record = record
+        self._comments = None
+        self.id = record.id
+        self.comment_sort = "confidence"
+        self.mod = SubmissionModeration(self)
+
+    fullname = property(lambda self: "t3_" + self.id)
+    title = property(lambda self: self._record.title)
+    permalink = property(lambda self: f"/r/{self._record.subreddit}/comments/{self.id}/")
+    created_utc = property(lambda self: self._record.created_utc)
+    distinguished = property(lambda self: self._record.distinguished)
+    removed = property(lambda self: self._record.removed)
+    approved = property(lambda self: self._record.approved)
+    subreddit = property(lambda self: SubredditName(self._record.subreddit))
+    num_comments = property(lambda self: len(self._record.comments))
+
+    @property
+    def author(self):
+        return None if self._record.deleted else self._record.author
+
+    @property
+    def removed_by_category(self):
+        return "deleted" if self._record.deleted else ("moderator" if self._record.removed else None)
+
+    @property
+    def comments(self):
+        if self._comments is None:
+            # First look at the comments on this object - one request, the same as PRAW fetching the post
+            self._world.count("comments")
+            top_level = [comment for comment in self._record.comments if not comment.deleted]
+            if self.comment_sort == "old":
+                top_level.sort(key=lambda comment: comment.created_utc)
+            else:
+                top_level.sort(key=lambda comment: -len(comment.replies))
+            top_level.sort(key=lambda comment: not comment.stickied) # Stickied comments always come first
+            views = [Comment(self._world, comment.id, comment) for comment in top_level]
+            self._comments = CommentForest(views[:COMMENTS_PER_FETCH], views[COMMENTS_PER_FETCH:])
+        return self._comments
+
+    def reply(self, body):
+        self._world.count("write")
+        return self._world.add_comment(self._record, None, self._world.bot, body)
+
+    def report(self, reason):
+        self._world.count("write")
+        self._record.reported = True
+        self._record.mod_note = reason
+        self._world.enforced(self._record)
+
+    def __eq__(self, other):
+        return isinstance(other, Submission) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def listing_page(items, limit, params):
+    # Reddit's listing behaviour: newest first. With "before" set, the items just newer than the given fullname, and with "after" set, the items
+    # just older than it (or nothing at all if that item has gone from the listing)
+    before = (params or {}).get("before")
+    after = (params or {}).get("after")
+    if before is not None or after is not None:
+        fullnames = [item.fullname for item in items]
+        if (before or after) not in fullnames:
+            return []
+        if before is not None:
+            items = items[:fullnames.index(before)]
+            return items[-limit:] if limit else items
+        items = items[fullnames.index(after) + 1:]
+    return items[:limit] if limit else items
+
+
+class ModAction:
+    def __init__(self, action_id, action, target_fullname, mod, subreddit, created_utc):
+        self.id = action_id
+        self.subreddit = subreddit
+        self.action = action
+        self.target_fullname = target_fullname
+        self.mod = mod
+        self.created_utc = created_utc
+
+    fullname = property(lambda self: self.id) # What listing_page compares against; Reddit's mod log uses the ID for "before" and "after"
+
+
+class SubredditModeration:
+    def __init__(self, subreddit):
+        self.subreddit = subreddit
+
+    def log(self, limit=100, params=None, **kwargs):
+        world = self.subreddit._world
+        world.count("modlog")
+        actions = [action for action in reversed(world.mod_log) if action.subreddit.lower() in self.subreddit._names]
+        return listing_page(actions, limit, params)
+
+
+class Subreddit:
+    def __init__(self, world, name):
+        self._world = world
+        self.display_name = name
+        self._names = {part.lower() for part in name.split("+")}
+        self.mod = SubredditModeration(self)
+
+    def _visible(self):
+        records = [record for record in self._world.posts.values() if record.subreddit.lower() in self._names and record.created_utc <= self._world.clock.now]
+        records.sort(key=lambda record: record.created_utc, reverse=True)
+        return [Submission(self._world, record) for record in records]
+
+    def new(self, limit=100, params=None, **kwargs):
+        if limit is None and not params:
+            # Paging back through the whole listing - like PRAW's ListingGenerator, a request per 100 posts and only as far as the caller reads
+            return self._pages(self._visible())
+        self._world.count("listing", max(1, math.ceil((limit or 1000) / 100)) if not params or params.get("before") is None else 1)
+        return listing_page(self._visible(), limit or 1000, params)
+
+    def _pages(self, submissions):
+        for n, submission in enumerate(submissions):
+            if n % 100 == 0:
+                self._world.count("listing")
+            yield submission
+
+    def top(self, time_filter="day", limit=100, **kwargs):
+        self._world.count("listing", max(1, math.ceil((limit or 1000) / 100)))
+        return self._visible()[:limit or 1000]
+
+
+class Inbox:
+    def __init__(self, world):
+        self._world = world
+
+    def comment_replies(self, limit=100, params=None, **kwargs):
+        self._world.count("inbox")
+        replies = [Comment(self._world, record.id, record) for record in reversed(self._world.inbox)]
+        return listing_page(replies, limit, params)
+
+
+class Auth:
+    def __init__(self, world):
+        self._world = world
+
+    @property
+    def limits(self):
+        return {"remaining": self._world.rate_limit_remaining, "reset_timestamp": self._world.rate_limit_reset, "used": self._world.rate_limit - self._world.rate_limit_remaining}
+
+
+class Reddit:
+    def __init__(self, world):
+        self._world = world
+        self.inbox = Inbox(world)
+        self.auth = Auth(world)
+
+    def subreddit(self, name):
+        return Subreddit(self._world, name)
+
+    def submission(self, id=None):
+        return Submission(self._world, self._world.posts[id])
+
+    def comment(self, id=None):
+        return Comment(self._world, id)
+
+    def info(self, fullnames=None, **kwargs):
+        fullnames = list(fullnames)
+        self._world.count("info", math.ceil(len(fullnames) / 100))
+        for fullname in fullnames:
+            kind, item_id = fullname.split("_", 1)
+            if kind == "t3" and item_id in self._world.posts:
+                yield Submission(self._world, self._world.posts[item_id])
+            elif kind == "t1" and item_id in self._world.comments:
+                yield Comment(self._world, item_id, self._world.comments[item_id])
+
+
+###############################################################################
+###
+### Simulated world -- the scenario being played out
+###
+###############################################################################
+
+class World:
+    def __init__(self, clock, bot_name):
+        self.clock = clock
+        self.bot = Redditor(bot_name)
+        self.reddit = Reddit(self)
+        self.posts = {}
+        self.comments = {}
+        self.inbox = [] # Replies to the bot's comments, oldest first
+        self.mod_log = [] # Moderator actions, oldest first
+        self.pending = [] # (time, post id, author, body, depth) - comments waiting for their time to come
+        self.requests_by_post = {} # post id -> the bot's request comment record
+        self.ss_by_post = {} # post id -> [(offset from request, body)] for OP's replies to the request
+        self.next_comment_id = 36 ** 5
+        self.counts = {}
+        self.request_hook = None # Called for each request, in place of the hook the bot puts on PRAW's HTTP session
+        self.rate_limit = RATE_LIMIT
+        self.rate_limit_remaining = RATE_LIMIT
+        self.rate_limit_reset = clock.now + RATE_LIMIT_WINDOW
+        self.time_limit_seconds = 0
+        self.enforcement_lag = []
+        self.duplicate_requests = 0
+
+    def count(self, kind, requests=1):
+        self.counts[kind] = self.counts.get(kind, 0) + requests
+        # Reddit allows RATE_LIMIT requests in each RATE_LIMIT_WINDOW seconds
+        if self.clock.now >= self.rate_limit_reset:
+            self.rate_limit_remaining = self.rate_limit
+            self.rate_limit_reset = self.clock.now + RATE_LIMIT_WINDOW
+        if self.request_hook is not None:
+            for n in range(requests):
+                self.request_hook(None)
+        if self.rate_limit_remaining < requests:
+            self.rate_limit_remaining = 0
+            raise TooManyRequests(f"rate limit used up until {self.rate_limit_reset - START_TIME:.0f}")
+        self.rate_limit_remaining -= requests
+
+    def log_action(self, action, target_fullname, mod):
+        kind, item_id = target_fullname.split("_", 1)
+        subreddit = (self.posts[item_id] if kind == "t3" else self.comments[item_id].post).subreddit
+        self.mod_log.append(ModAction(f"ModAction_{len(self.mod_log) + 1}", action, target_fullname, mod, subreddit, self.clock.now))
+
+    def enforced(self, post):
+        if post.enforced_at is None:
+            post.enforced_at = self.clock.now
+            self.enforcement_lag.append(self.clock.now - (post.created_utc + self.time_limit_seconds))
+
+    def add_comment(self, post, parent, author, body):
+        self.next_comment_id += 1
+        record = CommentRecord(self, base36(self.next_comment_id), post, parent, author, body, self.clock.now)
+        self.comments[record.id] = record
+        (parent.replies if parent is not None else post.comments).append(record)
+        if parent is not None and parent.author == self.bot:
+            self.inbox.append(record)
+        if parent is None and author == self.bot and "Submission Statement Request" in body:
+            # The bot has asked for a submission statement - OP's replies (if any) can now be scheduled
+            if post.id in self.requests_by_post:
+                self.duplicate_requests += 1
+            self.requests_by_post[post.id] = record
+            for offset, ss_body in self.ss_by_post.get(post.id, []):
+                self.pending.append((self.clock.now + offset, post.id, post.author, ss_body, "request"))
+        return Comment(self, record.id, record)
+
+    def load(self, scenario):
+        for post in scenario["posts"]:
+            record = PostRecord(self, post["id"], post["subreddit"], Redditor(post["author"]), post["title"], START_TIME + post["created_offset"], post.get("distinguished"))
+            record.spam = post.get("spam", False)
+            self.posts[record.id] = record
+            self.ss_by_post[record.id] = [(ss["offset"], ss["body"]) for ss in post.get("submission_statements", [])]
+            for comment in post.get("comments", []):
+                self.pending.append((record.created_utc + comment["offset"], record.id, Redditor(comment["author"]), comment["body"], comment["depth"]))
+            for action in post.get("moderator_actions", []):
+                self.pending.append((record.created_utc + action["offset"], record.id, Redditor(action["mod"]), None, action["action"]))
+
+    def tick(self):
+        # Post anything whose time has come
+        due = [item for item in self.pending if item[0] <= self.clock.now]
+        self.pending = [item for item in self.pending if item[0] > self.clock.now]
+        for at, post_id, author, body, depth in sorted(due, key=lambda item: item[0]):
+            post = self.posts[post_id]
+            if depth in ("removelink", "approvelink"):
+                # Another moderator acting on the post
+                if post.enforced_at is None:
+                    post.removed = depth == "removelink"
+                    post.approved = depth == "approvelink"
+                    self.log_action(depth, "t3_" + post.id, author)
+                continue
+            if depth == "request":
+                parent = self.requests_by_post.get(post_id)
+                if parent is None or parent.deleted:
+                    continue
+            else:
+                parent = None
+                for level in range(depth):
+                    siblings = parent.replies if parent is not None else post.comments
+                    if len(siblings) == 0:
+                        break
+                    parent = siblings[-1]
+            self.add_comment(post, parent, author, body)
+
+
+def base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    text = ""
+    while number > 0:
+        number, remainder = divmod(number, 36)
+        text = digits[remainder] + text
+    return text or "0"
+
+
+def random_word(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for i in range(rng.randint(2, 10)))
+
+
+def generate_scenario(args):
+    # A synthetic scenario: a steady flow of posts with the occasional burst, OP replying (or not) within the time limit, and busy comment threads
+    rng = random.Random(args.seed)
+    spam_words = [random_word(rng) for i in range(40)]
+    subreddits = args.subreddits.split(",")
+    time_limit = args.minutes_to_wait * 60
+    posts = []
+    post_number = 36 ** 5
+    for cycle in range(args.cycles):
+        arrivals = args.posts_per_cycle + (args.burst_size if args.burst_every and cycle > 0 and cycle % args.burst_every == 0 else 0)
+        for n in range(arrivals):
+            post_number += 1
+            author = f"user{rng.randrange(args.posts_per_cycle * args.cycles * 4 + 1)}"
+            post = {
+                "id": base36(post_number),
+                "subreddit": rng.choice(subreddits),
+                "author": author,
+                "title": f"Post {post_number}",
+                "created_offset": (cycle - 1) * args.interval + rng.uniform(1, args.interval),
+                "submission_statements": [],
+                "comments": [],
+                "moderator_actions": [],
+            }
+            if rng.random() < args.distinguished_rate:
+                post["distinguished"] = "moderator"
+            if rng.random() < args.spam_rate:
+                # One of a spam ring's posts: the same statement each time, with a couple of words changed
+                words = spam_words.copy()
+                for change in range(2):
+                    words[rng.randrange(len(words))] = random_word(rng)
+                post["spam"] = True
+                post["submission_statements"].append({"offset": rng.uniform(5, time_limit * 0.9), "body": "submission statement " + " ".join(words)})
+            elif rng.random() < args.reply_rate:
+                length = rng.choice([40, 150, 300, 600])
+                post["submission_statements"].append({"offset": rng.uniform(5, time_limit * 0.9), "body": "submission statement " + " ".join(random_word(rng) for i in range(length // 8))})
+            if rng.random() < args.mod_removal_rate:
+                post["moderator_actions"].append({"offset": rng.uniform(5, time_limit * 0.9), "action": "removelink", "mod": "othermod"})
+            elif rng.random() < args.mod_approval_rate:
+                post["moderator_actions"].append({"offset": rng.uniform(5, time_limit * 0.9), "action": "approvelink", "mod": "othermod"})
+            for c in range(args.comments_per_post):
+                post["comments"].append({"offset": rng.uniform(1, time_limit * 2), "author": f"commenter{rng.randrange(1000)}", "body": "a comment " * rng.randint(1, 20), "depth": rng.randrange(args.thread_depth + 1)})
+            posts.append(post)
+    return {"posts": posts}
+
+
+###############################################################################
+###
+### Benchmark run
+###
+###############################################################################
+
+def load_bot(clock):
+    # The bot is a script (with dashes in its name), so load it from its path and swap its clock for the simulated one
+    spec = importlib.util.spec_from_file_location("submission_statement_bot", BOT_PATH)
+    bot = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot)
+    bot.datetime = clock_datetime(clock)
+    bot.time = ClockTime(clock)
+    return bot
+
+
+def load_config(args):
+    cfg = ConfigParser(interpolation = ExtendedInterpolation(), converters={'list': lambda x: [i.strip() for i in x.split(',')] if len(x) > 0 else []})
+    cfg.read(CONFIG_PATH)
+    cfg['DEFAULT']['subreddit'] = args.subreddits.split(",")[0]
+    cfg['DEFAULT']['minutes_to_wait_for_submission_statement'] = str(args.minutes_to_wait)
+    cfg['DEFAULT']['bot_interval'] = str(args.interval)
+    cfg['DEFAULT']['state_database'] = ":memory:"
+    if len(args.subreddits.split(",")) > 1:
+        for name in args.subreddits.split(","):
+            cfg.add_section("subreddit:" + name)
+    for option in args.set or []:
+        key, value = option.split("=", 1)
+        cfg['DEFAULT'][key.strip()] = value.strip()
+    return cfg
+
+
+def run(args, scenario):
+    clock = Clock(START_TIME)
+    bot = load_bot(clock)
+    bot.cfg = load_config(args)
+    world = World(clock, bot.cfg['CREDENTIALS']['username'])
+    world.time_limit_seconds = args.minutes_to_wait * 60
+    world.rate_limit = world.rate_limit_remaining = args.rate_limit
+    world.load(scenario)
+
+    tracemalloc.start()
+    bot_only = [tracemalloc.Filter(True, BOT_PATH)]
+    results = []
+    if args.restart_after or args.workers > 1:
+        # The state database has to outlive the first Janitor for the second one to pick up where it left off, and is shared between the workers
+        state_directory = tempfile.TemporaryDirectory()
+        bot.cfg['DEFAULT']['state_database'] = os.path.join(state_directory.name, "state.db")
+
+    def start_workers():
+        bot.cfg['DEFAULT']['worker_count'] = str(args.workers)
+        janitors = []
+        for index in range(args.workers):
+            bot.cfg['DEFAULT']['worker_index'] = str(index)
+            with redirect_stdout(io.StringIO()):
+                janitors.append(bot.Janitor(bot.load_subreddit_settings(), connect=lambda: Reddit(world)))
+        return janitors
+
+    janitors = start_workers()
+    clock.advance(args.interval)
+    for cycle in range(args.cycles):
+        if args.restart_after and cycle == args.restart_after:
+            # Stop the bot, leave it down for a while (posts keep arriving), and start a new one
+            clock.advance(args.downtime)
+            janitors = start_workers()
+        if args.fail_worker_after and cycle == args.fail_worker_after and len(janitors) > 1:
+            # Worker 0 stops for good; the others should pick up its posts once its leases run out
+            janitors = janitors[1:]
+        world.tick()
+        world.counts = {}
+        lag_before = len(world.enforcement_lag)
+        output = io.StringIO()
+        started = time.perf_counter()
+        # The workers run one after another, rather than side by side, so the results are the same from run to run
+        failed = 0
+        for janitor in janitors:
+            world.request_hook = janitor.metrics.count_request
+            with redirect_stdout(output):
+                try:
+                    janitor.update_submission_list()
+                    janitor.handle_posts()
+                except Exception as e:
+                    # As in go(): report it and carry on next time around
+                    print(f"\n---ERROR---\n{e!r}")
+                    failed += 1
+        wall = time.perf_counter() - started
+        wait = min(janitor.wait_time() for janitor in janitors) # bot_interval, or with adaptive_polling whatever the bot decides
+        memory = sum(stat.size for stat in tracemalloc.take_snapshot().filter_traces(bot_only).statistics("filename"))
+        results.append({
+            "cycle": cycle + 1,
+            "simulated_time": clock.now - START_TIME,
+            "wait_seconds": wait,
+            "wall_seconds": wall,
+            "api_calls": dict(world.counts),
+            "api_total": sum(world.counts.values()),
+            "tracked": sum(len(janitor.submissions) for janitor in janitors),
+            "enforced": len(world.enforcement_lag) - lag_before,
+            "failed": failed,
+            "bot_memory_bytes": memory,
+        })
+        if args.verbose:
+            print(output.getvalue())
+        clock.advance(wait)
+    tracemalloc.stop()
+
+    # Posts that the bot should have done something with by now but didn't: their time ran out more than a cycle ago (or, if a worker was
+    # stopped, long enough ago for its leases to run out), and nobody else dealt with them
+    settings = janitors[0].sub_settings
+    exempt_approved = settings.use_mod_log and settings.moderator_approval_exempts
+    allowance = world.time_limit_seconds + 2 * args.interval + (settings.lease_seconds + world.time_limit_seconds if args.fail_worker_after else 0)
+    missed = [record.id for record in world.posts.values() if record.created_utc > START_TIME and record.enforced_at is None and record.distinguished is None
+              and not record.removed and not (record.approved and exempt_approved) and record.created_utc + allowance < clock.now]
+
+    # Posts removed/reported for having no submission statement, although OP had replied to the request before the bot acted
+    ignored_replies = [record.id for record in world.posts.values() if record.mod_note == "No submission statement provided" and record.id in world.requests_by_post
+                       and any(reply.author == record.author and reply.created_utc < record.enforced_at for reply in world.requests_by_post[record.id].replies)]
+
+    # Spam ring posts the bot caught as copies, and any genuine posts it wrongly took for copies
+    copies = [record for record in world.posts.values() if record.mod_note is not None and "copies another user" in record.mod_note]
+    spam = [record for record in world.posts.values() if record.spam and record.enforced_at is not None]
+    return results, {
+        "enforcement_lag_seconds": world.enforcement_lag,
+        "missed_posts": missed,
+        "ignored_replies": ignored_replies,
+        "duplicate_requests": world.duplicate_requests,
+        "spam_posts": len(spam),
+        "spam_caught": sum(1 for record in copies if record.spam),
+        "wrongly_taken_for_copies": sum(1 for record in copies if not record.spam),
+    }
+
+
+def report(results, summary):
+    print(f"{'cycle':>5} {'sim time':>8} {'wait':>5} {'wall ms':>9} {'calls':>6} {'listing':>7} {'inbox':>5} {'info':>5} {'modlog':>6} {'comments':>8} {'more':>5} {'write':>6} {'tracked':>7} {'enforced':>8} {'bot KiB':>8}")
+    for result in results:
+        calls = result["api_calls"]
+        print(f"{result['cycle']:>5} {result['simulated_time']:>8.0f} {result['wait_seconds']:>5} {result['wall_seconds'] * 1000:>9.1f} {result['api_total']:>6} {calls.get('listing', 0):>7} {calls.get('inbox', 0):>5} {calls.get('info', 0):>5} {calls.get('modlog', 0):>6} "
+              f"{calls.get('comments', 0):>8} {calls.get('more', 0):>5} {calls.get('write', 0):>6} {result['tracked']:>7} {result['enforced']:>8} {result['bot_memory_bytes'] / 1024:>8.1f}")
+    print("---")
+    walls = [result["wall_seconds"] for result in results]
+    calls = [result["api_total"] for result in results]
+    print(f"cycle wall time   mean {statistics.mean(walls) * 1000:.1f} ms, max {max(walls) * 1000:.1f} ms")
+    print(f"API calls/cycle   mean {statistics.mean(calls):.1f}, max {max(calls)}, total {sum(calls)}")
+    lags = summary["enforcement_lag_seconds"]
+    if len(lags) > 0:
+        print(f"enforcement lag   mean {statistics.mean(lags):.1f} s, max {max(lags):.1f} s after the deadline ({len(lags)} posts)")
+    print(f"duplicate requests {summary['duplicate_requests']} (posts asked for a submission statement more than once)")
+    print(f"failed cycles      {sum(result['failed'] for result in results)} (an error reached the main loop, e.g. from running out of rate limit)")
+    print(f"missed posts       {len(summary['missed_posts'])} (time ran out, but never removed, reported or validated)")
+    print(f"ignored replies    {len(summary['ignored_replies'])} (removed/reported for no submission statement, although OP had replied to the request)")
+    print(f"copied statements  {summary['spam_caught']} of {summary['spam_posts']} spam ring posts caught, {summary['wrongly_taken_for_copies']} other posts wrongly taken for copies")
+    print(f"peak bot memory   {max(result['bot_memory_bytes'] for result in results) / 1024:.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the submission statement bot, using a fake Reddit backend")
+    parser.add_argument("--cycles", type=int, default=30, help="number of bot cycles to run")
+    parser.add_argument("--interval", type=int, default=300, help="simulated seconds between cycles (bot_interval)")
+    parser.add_argument("--minutes-to-wait", type=int, default=5, help="minutes_to_wait_for_submission_statement")
+    parser.add_argument("--subreddits", default="SubReddit", help="comma separated list of subreddits to spread the posts across")
+    parser.add_argument("--posts-per-cycle", type=int, default=20, help="posts arriving between cycles")
+    parser.add_argument("--burst-every", type=int, default=10, help="every this many cycles, a burst of extra posts arrives (0 = never)")
+    parser.add_argument("--burst-size", type=int, default=200, help="number of extra posts in a burst")
+    parser.add_argument("--comments-per-post", type=int, default=50, help="comments from other users on each post")
+    parser.add_argument("--thread-depth", type=int, default=4, help="how deep the comment threads go")
+    parser.add_argument("--reply-rate", type=float, default=0.8, help="fraction of posters that reply with a submission statement")
+    parser.add_argument("--distinguished-rate", type=float, default=0.02, help="fraction of posts made by moderators")
+    parser.add_argument("--mod-removal-rate", type=float, default=0.05, help="fraction of posts removed by another moderator before their deadline")
+    parser.add_argument("--mod-approval-rate", type=float, default=0.05, help="fraction of posts approved by another moderator before their deadline")
+    parser.add_argument("--restart-after", type=int, default=0, help="stop and restart the bot after this many cycles (0 = never)")
+    parser.add_argument("--downtime", type=int, default=1800, help="simulated seconds the bot is stopped for when restarted")
+    parser.add_argument("--workers", type=int, default=1, help="number of workers sharing the subreddit (worker_count)")
+    parser.add_argument("--fail-worker-after", type=int, default=0, help="stop worker 0 for good after this many cycles (0 = never)")
+    parser.add_argument("--rate-limit", type=int, default=RATE_LIMIT, help=f"requests allowed per {RATE_LIMIT_WINDOW} second rate limit window")
+    parser.add_argument("--spam-rate", type=float, default=0.02, help="fraction of posts from a spam ring, all with near-identical submission statements")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the synthetic scenario")
+    parser.add_argument("--set", action="append", metavar="OPTION=VALUE", help="override a [DEFAULT] bot setting, e.g. --set use_inbox_replies=False")
+    parser.add_argument("--replay", help="run a scenario from this JSON file instead of generating one")
+    parser.add_argument("--save", help="save the scenario to this JSON file")
+    parser.add_argument("--json", help="write the per-cycle results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own output")
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay) as f:
+            scenario = json.load(f)
+    else:
+        scenario = generate_scenario(args)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(scenario, f)
+
+    results, summary = run(args, scenario)
+    report(results, summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cycles": results, **summary}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
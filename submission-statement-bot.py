@@ -51,9 +51,22 @@
 # 3) DONE Submissions are being repeatedly added to the "to check" list whilst we're waiting for the timer to expire #Bug3 [Needed to re-implement __eq__ to allow union function to dedupe properly]
 # 4) DONE "Actions taken" counter not working correctly, doesn't increment per action taken! #Bug4 [Indentation was wrong. Now moved to centralised function.]
 
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser, ExtendedInterpolation
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import heapq
+import json
+import math
 import praw
+import re
+import requests
+import sqlite3
+import threading
 import time
 import traceback
 
@@ -64,34 +77,249 @@ import traceback
 ###############################################################################
 
 class SSBSettings():
-    def __init__(self):
+    # Options that apply to the bot as a whole, so they're only read from [DEFAULT] - a [subreddit:Name] section can't override them (see load_subreddit_settings)
+    BOT_WIDE_OPTIONS = ('bot_interval', 'adaptive_polling', 'bot_min_interval', 'bot_max_interval', 'use_inbox_replies', 'use_mod_log', 'action_workers',
+                        'rate_limit_reserve', 'metrics_port', 'json_logs', 'state_database', 'tracking_window_hours', 'catch_up_hours', 'worker_count',
+                        'worker_index', 'lease_seconds', 'duplicate_statement_threshold', 'duplicate_statement_window_hours')
+
+    def __init__(self, section='DEFAULT'):
+        # "section" is either DEFAULT, or a [subreddit:Name] section (see load_subreddit_settings) with any of the DEFAULT/TEXT options overridden for that subreddit
         try:
-            self.subreddit = cfg['DEFAULT']['subreddit']
+            settings = cfg[section]
+            text = cfg['TEXT'] if section == 'DEFAULT' else cfg[section]
+            # With [subreddit:Name] sections, DEFAULT doesn't need a subreddit - it's only used for the bot-wide options then, so the TEXT templates
+            # (which refer to ${DEFAULT:subreddit}) aren't read for it either
+            self.subreddit = settings.get('subreddit')
+            if self.subreddit is None and not any(name.startswith("subreddit:") for name in cfg.sections()):
+                raise ValueError("no subreddit set - add subreddit to [DEFAULT], or a [subreddit:Name] section for each subreddit")
+            has_text = self.subreddit is not None
             #.encode('raw_unicode_escape').decode('unicode_escape') is required as ConfigParser will escape items such as "\n" to "\\n" and remove the newline functionality.
             # See here for why we've done it this way: https://stackoverflow.com/questions/1885181/how-to-un-escape-a-backslash-escaped-string/69772725#69772725
-            self.removal_reason = str(cfg['TEXT']['removal_reason']).encode('raw_unicode_escape').decode('unicode_escape')
-            self.report_reason = str(cfg['TEXT']['report_reason']).encode('raw_unicode_escape').decode('unicode_escape')
-            if int(cfg['DEFAULT']['minutes_to_wait_for_submission_statement']) >= 1: # Enforce 1 minute minimum
-                self.submission_statement_time_limit_minutes = int(cfg['DEFAULT']['minutes_to_wait_for_submission_statement']) 
+            self.removal_reason = str(text['removal_reason']).encode('raw_unicode_escape').decode('unicode_escape') if has_text else None
+            self.report_reason = str(text['report_reason']).encode('raw_unicode_escape').decode('unicode_escape') if has_text else None
+            if int(settings['minutes_to_wait_for_submission_statement']) >= 1: # Enforce 1 minute minimum
+                self.submission_statement_time_limit_minutes = int(settings['minutes_to_wait_for_submission_statement']) 
             else:
                 self.submission_statement_time_limit_minutes = 1   
-            self.submission_statement_request_text = str(cfg['TEXT']['submission_statement_request']).encode('raw_unicode_escape').decode('unicode_escape')
-            self.submission_statement_minimum_char_length = int(cfg['DEFAULT']['submission_statement_minimum_char_length'])
+            self.submission_statement_request_text = str(text['submission_statement_request']).encode('raw_unicode_escape').decode('unicode_escape') if has_text else None
+            self.submission_statement_minimum_char_length = int(settings['submission_statement_minimum_char_length'])
             self.report_insufficient_length = True
-            self.remove_posts = cfg['DEFAULT'].getboolean('remove_posts')
-            self.pin_submission_statement_request = cfg['DEFAULT'].getboolean('pin_submission_statement_request')
-            self.pin_submission_statement_response = cfg['DEFAULT'].getboolean('pin_submission_statement_response')
-            self.submission_reply_spoiler = cfg['DEFAULT'].getboolean('use_spolier_tags')
-            self.required_words = cfg['DEFAULT'].getlist('required_words_in_submission_statement')
-            self.remove_request_comment = cfg['DEFAULT'].getboolean('bot_remove_request')
-            print("Bot settings loaded successfully")
+            self.remove_posts = settings.getboolean('remove_posts')
+            self.pin_submission_statement_request = settings.getboolean('pin_submission_statement_request')
+            self.pin_submission_statement_response = settings.getboolean('pin_submission_statement_response')
+            self.submission_reply_spoiler = settings.getboolean('use_spolier_tags')
+            self.required_words = settings.getlist('required_words_in_submission_statement')
+            self.required_words_ignore_case = settings.getboolean('required_words_ignore_case', fallback=False)
+            self.required_words_whole_words = settings.getboolean('required_words_whole_words', fallback=False)
+            self.remove_request_comment = settings.getboolean('bot_remove_request')
+            self.edit_request_comment_in_place = settings.getboolean('edit_request_comment_in_place', fallback=False)
+            self.use_inbox_replies = settings.getboolean('use_inbox_replies', fallback=True)
+            self.use_mod_log = settings.getboolean('use_mod_log', fallback=False)
+            self.moderator_approval_exempts = settings.getboolean('moderator_approval_exempts', fallback=False)
+            self.action_workers = max(settings.getint('action_workers', fallback=0), 0)
+            self.bot_interval = max(settings.getint('bot_interval'), 30) # Enforce 30 second minimum
+            self.adaptive_polling = settings.getboolean('adaptive_polling', fallback=False)
+            self.bot_min_interval = max(settings.getint('bot_min_interval', fallback=30), 30)
+            self.bot_max_interval = max(settings.getint('bot_max_interval', fallback=self.bot_interval), self.bot_min_interval)
+            self.metrics_port = settings.getint('metrics_port', fallback=0)
+            self.json_logs = settings.getboolean('json_logs', fallback=False)
+            self.bot_footer_text = "\n\n*" + str(text['bot_footer_text']).encode('raw_unicode_escape').decode('unicode_escape') + "*" if has_text else None
+            self.tracking_window_hours = settings.getint('tracking_window_hours', fallback=24)
+            self.catch_up_hours = min(max(settings.getint('catch_up_hours', fallback=0), 0), self.tracking_window_hours)
+            self.worker_count = max(settings.getint('worker_count', fallback=1), 1)
+            self.worker_index = settings.getint('worker_index', fallback=0)
+            if not 0 <= self.worker_index < self.worker_count:
+                raise ValueError("worker_index must be from 0 to worker_count - 1")
+            self.duplicate_statement_threshold = min(max(settings.getfloat('duplicate_statement_threshold', fallback=0.0), 0.0), 1.0)
+            self.duplicate_statement_window_hours = max(settings.getint('duplicate_statement_window_hours', fallback=24), 1)
+            self.rate_limit_reserve = max(settings.getint('rate_limit_reserve', fallback=50), 0)
+            self.lease_seconds = max(settings.getint('lease_seconds', fallback=900), 2 * self.bot_max_interval) # Has to outlast the time between runs
+            self.state_database = settings.get('state_database', fallback='submission-statement-bot.db')
+            self.validator = SubmissionStatementValidator(self)
+            print("Bot settings loaded successfully" + (" for r/" + self.subreddit if self.subreddit is not None else ""))
         except Exception as e:
             print("\nERROR trying to load bot settings. Exiting. Error details follow: ")
             print(repr(e))
             traceback.print_exc()
             exit()
+
+
+def load_subreddit_settings():
+    # The bot can look after several subreddits at once. Each one gets a [subreddit:Name] section in the config, which can override the
+    # DEFAULT or TEXT options for that subreddit (apart from SSBSettings.BOT_WIDE_OPTIONS); anything not overridden comes from DEFAULT/TEXT as usual.
+    # If there are no such sections, the bot just runs on the "subreddit" from DEFAULT as it always has.
+    sections = [section for section in cfg.sections() if section.startswith("subreddit:")]
+    if len(sections) == 0:
+        settings = SSBSettings()
+        return {settings.subreddit.lower(): settings}
+
+    subreddit_settings = {}
+    for section in sections:
+        cfg[section]['subreddit'] = section[len("subreddit:"):].strip()
+        for key in SSBSettings.BOT_WIDE_OPTIONS:
+            if cfg.has_option(section, key) and (not cfg.has_option('DEFAULT', key) or cfg.get(section, key, raw=True) != cfg.get('DEFAULT', key, raw=True)):
+                print(f"WARNING: {key} in [{section}] is ignored - it applies to the bot as a whole, so it can only be set in [DEFAULT]")
+        # The TEXT templates refer to ${DEFAULT:subreddit} etc. Copy them into the section with those references pointed at the section itself,
+        # so that they pick up this subreddit's name (and any other options overridden for it) instead of the DEFAULT ones.
+        for key in ('removal_reason', 'report_reason', 'submission_statement_request', 'bot_footer_text'):
+            if not cfg.has_option(section, key):
+                cfg[section][key] = cfg.get('TEXT', key, raw=True).replace("${DEFAULT:", "${")
+        settings = SSBSettings(section)
+        subreddit_settings[settings.subreddit.lower()] = settings
+    return subreddit_settings
     
 
+###############################################################################
+###
+### Submission statement validation
+###
+###############################################################################
+
+class SubmissionStatementValidator:
+    # Everything that decides whether a submission statement passes, built once from the settings so the checks themselves are cheap.
+    # The required words are compiled into a single regular expression, so the statement is scanned once rather than once per word.
+
+    # The most results kept; the oldest are dropped after this. Far more than the number of posts the bot will have waiting at once.
+    CACHE_SIZE = 10000
+
+    # "submission" and "statement" as words in their own right (separated by whitespace), for picking out the SS from several replies
+    SUBMISSION_STATEMENT_WORDS = re.compile(r"(?:^|\s)(submission|statement)(?=\s|$)", re.IGNORECASE)
+
+    def __init__(self, settings):
+        self.minimum_length = settings.submission_statement_minimum_char_length
+        self.ignore_case = settings.required_words_ignore_case
+        self.required_words = {self.normalise(word) for word in settings.required_words if len(word) > 0}
+        self.results = {}
+        self.required_words_pattern = None
+        self.word_patterns = {}
+        if len(self.required_words) > 0:
+            flags = re.IGNORECASE if self.ignore_case else 0
+            boundary = r"\b" if settings.required_words_whole_words else ""
+            # Longest first, so that when one required word contains another the longer one is the one matched
+            alternatives = "|".join(re.escape(word) for word in sorted(self.required_words, key=len, reverse=True))
+            self.required_words_pattern = re.compile(boundary + "(?:" + alternatives + ")" + boundary, flags)
+            self.word_patterns = {word: re.compile(boundary + re.escape(word) + boundary, flags) for word in self.required_words}
+
+    def normalise(self, text):
+        return text.casefold() if self.ignore_case else text
+
+    def mentions_submission_statement(self, text):
+        # Does the comment say "submission statement" somewhere? (both words, anywhere, in any case)
+        return {word.lower() for word in self.SUBMISSION_STATEMENT_WORDS.findall(text)} == {"submission", "statement"}
+
+    def has_required_words(self, text):
+        # Are all of the required words in the statement?
+        if self.required_words_pattern is None:
+            return True
+        found = {self.normalise(word) for word in self.required_words_pattern.findall(text)}
+        missing = self.required_words - found
+        if len(missing) > 0 and len(found) > 0:
+            # A match uses up the text it matched, so a required word that's part of another one ("pot" in "potato") can be missed by the single scan.
+            # Only the words that weren't found need looking for again, and only when something was found.
+            missing = {word for word in missing if self.word_patterns[word].search(text) is None}
+        return len(missing) == 0
+
+    def validate(self, comment):
+        # Returns the reason the submission statement fails (used as the mod note), or None if it passes.
+        # Results are kept per comment and edit, so a statement is only checked again if it has been edited since.
+        key = (comment.id, comment.edited)
+        if key in self.results:
+            return self.results[key]
+
+        body = comment.body
+        if not len(body) >= self.minimum_length:
+            result = "Submission statement is too short"
+        elif not self.has_required_words(body):
+            result = "Submission statement does not contain the requisite words"
+        else:
+            result = None
+
+        self.results[key] = result
+        if len(self.results) > self.CACHE_SIZE:
+            del self.results[next(iter(self.results))] # dicts keep insertion order, so this is the oldest
+        return result
+
+
+class DuplicateStatementIndex:
+    # Spots a submission statement that is the same as (or very close to) one that another user gave recently, e.g. a spam ring pasting one statement
+    # into lots of posts. Each statement is boiled down to a MinHash signature: every three-word phrase in it is hashed 64 different ways, and the
+    # signature keeps the smallest hash of each kind. The share of numbers two signatures have in common then estimates the share of phrases the
+    # statements have in common. The signatures are then bucketed in bands (locality-sensitive
+    # hashing) so that a lookup only compares against the statements that land in the same buckets, rather than every statement in the index.
+    # https://en.wikipedia.org/wiki/MinHash
+    PERMUTATIONS = 64
+    CANDIDATE_CHANCE = 0.99 # How likely a statement exactly "threshold" similar to another must be to share a bucket with it (see __init__)
+    MAX_ENTRIES = 10000 # The oldest statements are dropped beyond this, however recent they are, so memory use stays bounded
+
+    def __init__(self, threshold, window_hours):
+        self.threshold = threshold
+        self.window_seconds = window_hours * 3600
+        # Two statements with similarity s share a bucket with probability 1 - (1 - s^rows)^bands, an S-curve that rises around (1 / bands)^(1 / rows).
+        # Use the longest bands (the fewest, most selective buckets) that still make a statement at the threshold a candidate CANDIDATE_CHANCE of the
+        # time, so the rise comes well below the threshold - e.g. a threshold of 0.5 gets 32 bands of 2 (rising around 0.18), and 0.9 gets 16 of 4.
+        for rows in (8, 4, 2, 1):
+            bands = self.PERMUTATIONS // rows
+            if 1 - (1 - threshold ** rows) ** bands >= self.CANDIDATE_CHANCE:
+                break
+        self.rows = rows
+        self.bands = bands
+        self.entries = {} # entry number -> (author, signature, permalink)
+        self.buckets = [{} for band in range(self.bands)] # for each band, hash of that band of a signature -> entry numbers (lists, which are smaller than sets when short)
+        self.added = deque() # (time added, entry number), oldest first
+        self.next_entry = 0
+
+    def signature(self, text):
+        words = re.findall(r"\w+", text.casefold())
+        phrases = {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+        # shake_128 gives as many bytes as we ask for, so one call per phrase provides all 64 of its hashes
+        hashes = [array("Q", hashlib.shake_128(phrase.encode()).digest(8 * self.PERMUTATIONS)) for phrase in phrases]
+        return array("Q", map(min, zip(*hashes)))
+
+    def band_keys(self, signature):
+        return [hash(tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+    def evict(self):
+        # Drop statements older than the window (and the oldest, if there are too many)
+        cutoff = time.time() - self.window_seconds
+        while len(self.added) > 0 and (self.added[0][0] < cutoff or len(self.entries) > self.MAX_ENTRIES):
+            added, entry = self.added.popleft()
+            author, signature, permalink = self.entries.pop(entry)
+            for band, key in enumerate(self.band_keys(signature)):
+                bucket = self.buckets[band][key]
+                bucket.remove(entry)
+                if len(bucket) == 0:
+                    del self.buckets[band][key]
+
+    def match(self, text, author, permalink):
+        # Returns (similarity, permalink) for the closest recent statement from a different author that is at least "threshold" similar,
+        # or None - in which case this statement is added to the index for later ones to be checked against.
+        self.evict()
+        signature = self.signature(text)
+        keys = self.band_keys(signature)
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(self.buckets[band].get(key, ()))
+
+        best = None
+        for entry in candidates:
+            other_author, other_signature, other_permalink = self.entries[entry]
+            if other_author == author:
+                continue # Users are free to reuse their own words
+            similarity = sum(1 for x, y in zip(signature, other_signature) if x == y) / self.PERMUTATIONS
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, other_permalink)
+        if best is not None:
+            return best
+
+        entry = self.next_entry
+        self.next_entry += 1
+        self.entries[entry] = (author, signature, permalink)
+        for band, key in enumerate(keys):
+            self.buckets[band].setdefault(key, []).append(entry)
+        self.added.append((time.time(), entry))
+        return None
+
+
 ###############################################################################
 ###
 ### Helper class -- wrapper for PRAW "submissions"
@@ -100,27 +328,43 @@ class SSBSettings():
 ###############################################################################
 
 class Post:
-    def __init__(self, submission, time_limit_minutes=30):
+    # __slots__ stops Python giving every instance its own __dict__, which keeps each post we're tracking small. 
+    # Anything not listed here can't be set on an instance, so new attributes need adding to this list.
+    __slots__ = ("id", "_submission", "_deadline", "_submission_statement_checked", "_submission_statement_valid", "_submission_statement",
+                 "_post_was_serviced", "_request_comment_id", "_response_comment_id", "_request_replies", "_comments", "_comments_cycle", "_writes", "_enforcement",
+                 "settings")
+
+    # The Janitor's current cycle number. Comment snapshots taken during an earlier cycle are out of date and get fetched again (see top_level_comments)
+    cycle = 0
+
+    def __init__(self, submission, settings):
+        self.id = int(submission.id, 36) # Reddit IDs are base36 numbers, and an int is far smaller (and quicker to hash) than the permalink string
+        self.settings = settings # The SSBSettings for the post's subreddit. Shared by every post from that subreddit, footer text and all, rather than copied into each one.
         self._submission = submission
-        self._created_time = datetime.fromtimestamp(submission.created_utc, tz=timezone.utc)
+        self._deadline = datetime.fromtimestamp(submission.created_utc, tz=timezone.utc) + timedelta(minutes=settings.submission_statement_time_limit_minutes)
         self._submission_statement_checked = False
         self._submission_statement_valid = False
         self._submission_statement = None
         self._post_was_serviced = False
-        self.bot_text = "\n\n*" + str(cfg['TEXT']['bot_footer_text']).encode('raw_unicode_escape').decode('unicode_escape') + "*"
-        self._time_limit = timedelta(hours=0, minutes=time_limit_minutes)
+        self._request_comment_id = None
+        self._response_comment_id = None
+        self._request_replies = None # Replies to the bot's request comment, as delivered to the inbox. None if we aren't getting them that way.
+        self._comments = None
+        self._comments_cycle = None
+        self._writes = None # Writes to Reddit that have gone through, while the actions they're part of are still under way (see write_once)
+        self._enforcement = None # (actions, number of writes they make) decided on when the post's time ran out, until they've all gone through (see Janitor.enforce_submission_statement)
 
     # https://www.pythontutorial.net
     # Python automatically calls the __eq__ method of a class when you use the == operator to compare the instances of the class. 
     # By default, Python uses the is operator if you don’t provide a specific implementation for the __eq__ method; we don't want that as the objects are different but we care about comparing the Reddit submission to avoid #Bug3
     def __eq__(self, other):
-        return self._submission.permalink == other._submission.permalink
+        return self.id == other.id
     
     # https://www.pythontutorial.net
     # If a class overrides the __eq__ method (which we have), the objects of the class become unhashable by default.
     # To make the Person class hashable, we also need to implement the __hash__ method.
     def __hash__(self):
-        return hash(self._submission.permalink)
+        return hash(self.id)
     
     # https://www.pythontutorial.net
     # # Sometimes, it’s useful to have a string representation of an instance of a class. 
@@ -128,7 +372,48 @@ class Post:
     def __str__(self):
         return f"{self._submission.permalink} | {self._submission.title}"
 
-    def candidate_submission_statement(self):
+    def top_level_comments(self):
+        # A snapshot of the post's top level comments. Everything that looks at the comments reads from this, so each post costs at most one comment fetch per cycle.
+        # Invalidation: the snapshot is thrown away at the start of each new cycle (Post.cycle moves on), and whenever the bot itself changes the comments (see invalidate_comments).
+        if self._comments is None or self._comments_cycle != Post.cycle:
+            # A new Submission object is needed here, as PRAW hangs on to the comments of one it has already fetched. The fetch also gives us the latest version of the post itself.
+            submission = self._submission._reddit.submission(id=self._submission.id)
+            # The bot's comments are made within a cycle of the post appearing, so sorting oldest first puts them at the front, well before any "more comments" cut-off
+            submission.comment_sort = "old"
+            self._submission = submission
+            # Leave out the top level "More comments" stubs rather than expanding the whole tree - we only need the top level. Not with
+            # replace_more(limit=0), as that drops the stubs further down too, including any under the bot's request comment (see find_request_comment)
+            self._comments = [comment for comment in submission.comments if not isinstance(comment, praw.models.MoreComments)]
+            self._comments_cycle = Post.cycle
+        return self._comments
+
+    def add_request_reply(self, reply):
+        # A reply to the bot's request comment has arrived (or been re-read). Deleted/removed replies are no use as a submission statement, so don't keep them.
+        if reply.author is None or reply.body in ("[deleted]", "[removed]"):
+            return
+        if self._request_replies is None:
+            self._request_replies = []
+        if reply not in self._request_replies: # PRAW compares comments by ID, so this catches one that the inbox gives us twice
+            self._request_replies.append(reply)
+
+    def invalidate_comments(self):
+        # The bot has added/removed comments, so the snapshot no longer reflects what's on the post
+        self._comments = None
+
+    def find_request_comment(self, janitor_name):
+        # Find the bot's "Submission Statement Request" comment in the snapshot, with all of its replies loaded
+        for top_level_comment in self.top_level_comments():
+            if self._request_comment_id is not None:
+                found = top_level_comment.id == self._request_comment_id
+            else:
+                found = top_level_comment.author is not None and top_level_comment.author.name == janitor_name and "Submission Statement Request" in top_level_comment.body
+            if found:
+                # Resolve the "More comments" stubs under the bot's comment only, rather than for the whole post
+                top_level_comment.replies.replace_more(limit=None)
+                return top_level_comment
+        return None
+
+    def candidate_submission_statement(self, janitor_name):
         # identify a possible submission statement
         
         # Is the post is distinguished? If so, it is assumed to be made in "official capacity" and can be ignored by SSbot
@@ -142,12 +427,17 @@ class Post:
         # We need to find the SS bot's comment, and then look at the replies to it
         # submission.comments is a CommentForest (A forest of comments starts with multiple top-level comments.) meaning we can address top level comments and their replies
         ss_candidates = []
-        for top_level_comment in self._submission.comments:
-            if top_level_comment.author is not None and top_level_comment.author.name == cfg['CREDENTIALS']['username'] and "Submission Statement Request" in top_level_comment.body:
+        if self._request_replies is not None:
+            # The replies have come to us through the inbox, so there's no need to read the comments. Take the ones from OP as SS candidates.
+            # (Inbox comments don't carry is_submitter, so compare against the post's author instead)
+            for reply in self._request_replies:
+                if reply.author is not None and reply.author == self._submission.author:
+                    ss_candidates.append(reply)
+        else:
+            request_comment = self.find_request_comment(janitor_name)
+            if request_comment is not None:
                 # found the bot comment, take the replies as SS candidates
-
-                self._submission.comments.replace_more() # Resolves the "More comments" text to get all comments
-                for reply in top_level_comment.replies:
+                for reply in request_comment.replies:
                     if reply.is_submitter:
                         ss_candidates.append(reply)
 
@@ -165,13 +455,9 @@ class Post:
         else:
             for candidate in ss_candidates:
                 
-                # Create a list of words in the comment
-                text = candidate.body
-                text = text.lower().strip().split()
-
                 # Check the comment for the words "submission" and "statement"
                 # (the author may have said "submission statement" in their comment, makes life easy)
-                if "submission" in text and "statement" in text:
+                if self.settings.validator.mentions_submission_statement(candidate.body):
                     self._submission_statement = candidate
                     break
 
@@ -183,62 +469,527 @@ class Post:
                     self._submission_statement = candidate
             return True
 
-    def has_time_expired(self, time_limit):
+    def deadline(self):
+        # The point in time at which the user has run out of time to add a submission statement
+        return self._deadline
+
+    def has_time_expired(self):
         # True or False -- has the time expired to add a submission statement?
-        return ((self._created_time + timedelta(minutes=time_limit)) < datetime.now(timezone.utc))
+        return (self.deadline() < datetime.now(timezone.utc))
 
-    def refresh(self, reddit):
+    def refresh(self, submission):
         # refresh the post with the latest version from Reddit to ensure any status changes etc are captured
-        self._submission = praw.models.Submission(reddit, id = self._submission.id)    
-
-    def submission_statement_previously_validated(self, janitor_name):
-        # have we already been through the validation process for this post's submission statement?
-        if self._submission_statement_valid == True:
-            return True
-        
-        self._submission_statement_valid = False
-        for comment in self._submission.comments:
-            if comment and comment.author and comment.author.name and comment.body:
-                if comment.author.name == janitor_name and "submission statement was provided" in comment.body:
-                    self._submission_statement_valid = True 
-                    self._submission_statement_checked = True
-                    break
-        return self._submission_statement_valid
-
-    def serviced_by_janitor(self, janitor_name):
-        # Serviced means the janitor has taken some kind of action - that has resulted in leaving a comment behind.
-        
-        if self._post_was_serviced:
-            return True
+        # "submission" has come back from a batched /api/info call, so it carries the moderation fields we care about (removed, approved, distinguished, num_comments etc.)
+        # without having fetched the comment tree. The comments are only fetched if and when something asks for them.
+        self._submission = submission
 
-        self._post_was_serviced = False
-        for reply in self._submission.comments:
-            if reply and reply.author and reply.author.name:
-                if reply.author.name == janitor_name:
-                    self._post_was_serviced = True 
-                    break
-        return self._post_was_serviced
+    def restart_clock(self):
+        # For a post we're only just getting round to (see Janitor.catch_up), the time limit runs from now - when we ask for the submission statement - rather than from when it was posted
+        self._deadline = datetime.now(timezone.utc) + timedelta(minutes=self.settings.submission_statement_time_limit_minutes)
 
-    def reply_to_post(self, text, pin=True, lock=False):
-        posted_comment = self._submission.reply(text + self.bot_text)
-        posted_comment.mod.distinguish(sticky=pin)
+    def release(self):
+        # We're finished with this post, so let go of the PRAW objects (and any comment tree they're holding on to)
+        self._submission = None
+        self._submission_statement = None
+        self._request_replies = None
+        self._comments = None
+        self._writes = None
+        self._enforcement = None
+
+    def is_deleted(self):
+        # The author has deleted their own post. There's nothing for us to do with these.
+        return self._submission.author is None or getattr(self._submission, "removed_by_category", None) == "deleted"
+
+    # The moderation actions below are given the Reddit instance to make their requests through. They can run on one of the ActionExecutor's
+    # threads, which each have their own instance (PRAW isn't thread safe), so the post is looked up through that rather than using self._submission.
+    # reddit.submission() doesn't fetch anything, it just gives us something to act on.
+
+    # Each write is made through write_once, so that if one of them fails the post's actions can be tried again (see ActionExecutor) without
+    # repeating the ones that went through - posting the same comment twice, say.
+
+    def write_once(self, name, write):
+        # Make the write, unless it has already gone through on an earlier try - either way, hand back what it returned
+        if self._writes is None:
+            self._writes = {}
+        if name not in self._writes:
+            self._writes[name] = write()
+        return self._writes[name]
+
+    def reply_to_post(self, reddit, text, pin=True, lock=False, name="reply"):
+        # "name" tells this comment's writes apart from any others the post's actions make
+        comment_id = self.write_once(name, lambda: reddit.submission(id=self._submission.id).reply(text + self.settings.bot_footer_text).id)
+        posted_comment = reddit.comment(comment_id)
+        self.write_once(name + " distinguish", lambda: posted_comment.mod.distinguish(sticky=pin))
+        if lock:
+            self.write_once(name + " lock", lambda: posted_comment.mod.lock())
+        self.invalidate_comments()
+        return posted_comment
+
+    def respond(self, reddit, text, pin=True, lock=False, request_comment=None):
+        # Reply to the post - or, given the bot's request comment (see edit_request_comment_in_place), turn that into the reply instead.
+        # An edited comment keeps its distinguished/sticky status, so it only needs distinguishing again if the reply is pinned differently to the request.
+        if request_comment is None:
+            return self.reply_to_post(reddit, text, pin=pin, lock=lock, name="response")
+        self.write_once("response", lambda: request_comment.edit(text + self.settings.bot_footer_text))
+        if pin != self.settings.pin_submission_statement_request:
+            self.write_once("response distinguish", lambda: request_comment.mod.distinguish(sticky=pin))
         if lock:
-            posted_comment.mod.lock()
+            self.write_once("response lock", lambda: request_comment.mod.lock())
+        self.invalidate_comments()
+        return request_comment
 
-    def remove_post(self, post_reply, mod_note):
-        self._submission.mod.remove(spam=False, mod_note=mod_note)
+    def remove_post(self, reddit, post_reply, mod_note, request_comment=None):
+        self.write_once("remove", lambda: reddit.submission(id=self._submission.id).mod.remove(spam=False, mod_note=mod_note))
         formatted_note = "\n\n(Removal reason: "+ mod_note +")"
-        removal_comment = self._submission.reply(post_reply + formatted_note + self.bot_text)
-        removal_comment.mod.distinguish(sticky=True)
+        removal_comment = self.respond(reddit, post_reply + formatted_note, pin=True, request_comment=request_comment)
+        self._response_comment_id = removal_comment.id
     
-    def report_post(self, post_reply, mod_note):
-        self._submission.report(mod_note)
-        reported_comment = self._submission.reply(post_reply + self.bot_text)
-        reported_comment.mod.distinguish(sticky=True)
+    def report_post(self, reddit, post_reply, mod_note, request_comment=None):
+        self.write_once("report", lambda: reddit.submission(id=self._submission.id).report(mod_note))
+        reported_comment = self.respond(reddit, post_reply, pin=True, request_comment=request_comment)
+        self._response_comment_id = reported_comment.id
         self._submission_statement_checked = True
 
 
 
+###############################################################################
+###
+### Persistent state -- what the bot has done to each post, kept on disk
+### https://docs.python.org/3/library/sqlite3.html
+###
+###############################################################################
+
+class StateStore:
+    # Post states. A post moves from REQUESTED to one of the others when its time runs out.
+    REQUESTED = "requested"     # We've asked for a submission statement and are waiting on the deadline
+    VALIDATED = "validated"     # A submission statement was provided and we've posted it
+    REMOVED = "removed"         # No (valid) submission statement - post removed
+    REPORTED = "reported"       # No (valid) submission statement - post reported for moderator attention
+    EXEMPT = "exempt"           # Another moderator removed (or approved, if moderator_approval_exempts is on) the post before its time ran out
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        # Write-ahead logging means a crash part way through a write can't leave the database corrupted, and readers don't block the writer
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS posts (
+                                    id TEXT PRIMARY KEY,
+                                    state TEXT NOT NULL,
+                                    created_utc REAL NOT NULL,
+                                    deadline_utc REAL NOT NULL,
+                                    request_comment_id TEXT,
+                                    response_comment_id TEXT,
+                                    updated_utc REAL NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS posts_by_state ON posts (state, deadline_utc)")
+        # Anything else the bot needs to remember between runs, e.g. how far through the subreddit it had got (see Janitor.start_catch_up)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # Which worker is handling which post, when several are sharing the database (see Janitor.claim)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS leases (
+                                    id TEXT PRIMARY KEY,
+                                    owner INTEGER NOT NULL,
+                                    expires_utc REAL NOT NULL)""")
+        self.connection.commit()
+
+    def record(self, post, state):
+        # Save the post's current state, along with the IDs of any comments the bot has made on it
+        with self.connection:
+            self.connection.execute("""INSERT INTO posts (id, state, created_utc, deadline_utc, request_comment_id, response_comment_id, updated_utc)
+                                       VALUES (?, ?, ?, ?, ?, ?, ?)
+                                       ON CONFLICT (id) DO UPDATE SET
+                                           state = excluded.state,
+                                           deadline_utc = excluded.deadline_utc,
+                                           request_comment_id = COALESCE(excluded.request_comment_id, posts.request_comment_id),
+                                           response_comment_id = COALESCE(excluded.response_comment_id, posts.response_comment_id),
+                                           updated_utc = excluded.updated_utc""",
+                                    (post._submission.id, state, post._submission.created_utc, post.deadline().timestamp(),
+                                     post._request_comment_id, post._response_comment_id, time.time()))
+
+    def get(self, submission_id):
+        # The stored row for a post, or None if we've never recorded it
+        return self.connection.execute("SELECT * FROM posts WHERE id = ?", (submission_id,)).fetchone()
+
+    def forget_before(self, timestamp):
+        # Clear out posts that are too old for the bot to see again. That includes any still marked as requested: they're well past their deadline,
+        # and without this they'd be fetched again by resume_in_flight_posts on every restart.
+        with self.connection:
+            self.connection.execute("DELETE FROM posts WHERE created_utc < ?", (timestamp,))
+            self.connection.execute("DELETE FROM leases WHERE expires_utc < ?", (timestamp,))
+
+    def claim(self, submission_ids, owner, expires_utc):
+        # Take the lease on each post for "owner" (or extend it, if it's already theirs), unless another worker holds a lease that hasn't expired.
+        # Each claim is a single statement, so two workers can't both get the same post. Returns the IDs that are now leased to "owner".
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("""INSERT INTO leases (id, owner, expires_utc) VALUES (?, ?, ?)
+                                           ON CONFLICT (id) DO UPDATE SET owner = excluded.owner, expires_utc = excluded.expires_utc
+                                           WHERE leases.owner = excluded.owner OR leases.expires_utc < ?""",
+                                        [(submission_id, owner, expires_utc, now) for submission_id in submission_ids])
+        claimed = set()
+        for start in range(0, len(submission_ids), 500): # SQLite limits the number of ?s in one statement
+            chunk = submission_ids[start:start + 500]
+            rows = self.connection.execute(f"SELECT id FROM leases WHERE owner = ? AND id IN ({','.join('?' * len(chunk))})", (owner, *chunk))
+            claimed.update(row["id"] for row in rows)
+        return claimed
+
+    def renew(self, submission_ids, owner, expires_utc):
+        # Extend the leases "owner" still holds, so the other workers can see it's alive
+        with self.connection:
+            self.connection.executemany("UPDATE leases SET expires_utc = ? WHERE owner = ? AND id = ?",
+                                        [(expires_utc, owner, submission_id) for submission_id in submission_ids])
+
+    def get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row["value"]
+
+    def set_meta(self, key, value):
+        with self.connection:
+            self.connection.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+    def in_flight(self):
+        # Posts we've asked for a submission statement on but haven't enforced yet, earliest deadline first
+        return self.connection.execute("SELECT * FROM posts WHERE state = ? ORDER BY deadline_utc", (self.REQUESTED,)).fetchall()
+
+
+###############################################################################
+###
+### Metrics -- what each cycle cost, for a Prometheus scrape and/or JSON logs
+### https://prometheus.io/docs/instrumenting/exposition_formats/
+###
+###############################################################################
+
+class Metrics:
+    PHASES = ("fetch", "refresh", "comments", "writes", "other")
+
+    def __init__(self, port=0, json_logs=False):
+        self.json_logs = json_logs
+        self.lock = threading.Lock() # Requests are counted from the action workers' threads as well as the main one
+        self.local = threading.local() # The phase each thread is currently in
+        self.requests_total = {phase: 0 for phase in self.PHASES}
+        self.requests_cycle = {phase: 0 for phase in self.PHASES}
+        self.seconds_total = {}
+        self.seconds_cycle = {}
+        self.lags_cycle = []
+        self.last_cycle_requests = 0
+        self.lag_sum = 0.0
+        self.lag_count = 0
+        self.cycles = 0
+        self.gauges = {}
+        if port:
+            self.start_server(port)
+
+    def count_request(self, response, *args, **kwargs):
+        # A "response" hook for the requests session PRAW uses, so every HTTP request the bot makes is counted against the phase it was made in
+        phase = getattr(self.local, "phase", "other")
+        with self.lock:
+            self.requests_total[phase] += 1
+            self.requests_cycle[phase] += 1
+
+    @contextmanager
+    def phase(self, name):
+        # Count any requests made inside the "with" block against this phase
+        previous = getattr(self.local, "phase", "other")
+        self.local.phase = name
+        try:
+            yield
+        finally:
+            self.local.phase = previous
+
+    @contextmanager
+    def timed(self, step):
+        # Time the "with" block
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock: # A new step appearing would change the dict while the metrics server is going through it
+                self.seconds_total[step] = self.seconds_total.get(step, 0.0) + elapsed
+                self.seconds_cycle[step] = self.seconds_cycle.get(step, 0.0) + elapsed
+
+    def enforcement_lag(self, seconds):
+        # How long after the post's deadline the action actually landed
+        with self.lock: # So the metrics server never sees the sum updated without the count
+            self.lags_cycle.append(seconds)
+            self.lag_sum += seconds
+            self.lag_count += 1
+
+    def end_cycle(self, janitor):
+        # Take the gauges, log the cycle if we're logging JSON, and reset the per-cycle figures
+        limits = janitor.reddit.auth.limits
+        with self.lock:
+            self.cycles += 1
+            self.gauges = {
+                "tracked_posts": len(janitor.submissions),
+                "waiting_posts": len(janitor.scheduled),
+                "checked_submissions": len(janitor.checked_submissions),
+                "ratelimit_remaining": limits.get("remaining"),
+                "ratelimit_reset_timestamp": limits.get("reset_timestamp"),
+                "posts_seen": janitor.post_counter,
+                "actions_taken": janitor.action_counter,
+                "deferred_requests": janitor.budget.deferred[BudgetPlanner.REQUEST],
+                "deferred_refreshes": janitor.budget.deferred[BudgetPlanner.REFRESH],
+                "deferred_speculative_reads": janitor.budget.deferred[BudgetPlanner.SPECULATIVE],
+            }
+            if self.json_logs:
+                print(json.dumps({
+                    "event": "cycle",
+                    "cycle": janitor.cycle,
+                    "time": datetime.now(timezone.utc).isoformat(),
+                    "requests": dict(self.requests_cycle),
+                    "seconds": {step: round(seconds, 3) for step, seconds in self.seconds_cycle.items()},
+                    "enforcement_lag_seconds": [round(lag, 1) for lag in self.lags_cycle],
+                    **self.gauges,
+                }))
+            self.last_cycle_requests = sum(self.requests_cycle.values())
+            self.requests_cycle = {phase: 0 for phase in self.PHASES}
+            self.seconds_cycle = {}
+            self.lags_cycle = []
+
+    def prometheus_text(self):
+        with self.lock:
+            lines = ["# HELP ssb_http_requests_total Reddit API requests made, by phase of the bot's cycle",
+                     "# TYPE ssb_http_requests_total counter"]
+            lines += [f'ssb_http_requests_total{{phase="{phase}"}} {count}' for phase, count in self.requests_total.items()]
+            lines += ["# HELP ssb_step_seconds_total Time spent in each step of the bot's cycle",
+                      "# TYPE ssb_step_seconds_total counter"]
+            lines += [f'ssb_step_seconds_total{{step="{step}"}} {seconds:.6f}' for step, seconds in self.seconds_total.items()]
+            lines += ["# HELP ssb_enforcement_lag_seconds How long after a post's deadline the bot acted on it",
+                      "# TYPE ssb_enforcement_lag_seconds summary",
+                      f"ssb_enforcement_lag_seconds_sum {self.lag_sum:.3f}",
+                      f"ssb_enforcement_lag_seconds_count {self.lag_count}",
+                      "# TYPE ssb_cycles_total counter",
+                      f"ssb_cycles_total {self.cycles}"]
+            for name, value in self.gauges.items():
+                if value is not None:
+                    lines += [f"# TYPE ssb_{name} gauge", f"ssb_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def start_server(self, port):
+        # Serve the metrics on http://localhost:<port>/metrics from a background thread
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Don't fill the bot's output with a line for every scrape
+
+        server = ThreadingHTTPServer(("localhost", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://localhost:{port}/metrics")
+
+
+###############################################################################
+###
+### Moderation actions -- replies, removals etc., optionally run in the background
+### https://docs.python.org/3/library/concurrent.futures.html
+###
+###############################################################################
+
+class ActionExecutor:
+    # Number of requests to keep back, per worker, from the rate limit. When we get down to this many we wait for the limit to reset.
+    RESERVE_PER_WORKER = 10
+
+    def __init__(self, reddit, workers, metrics, connect):
+        self.reddit = reddit
+        self.metrics = metrics
+        self.reserve = self.RESERVE_PER_WORKER * workers
+        self.throttle_lock = threading.Lock()
+        self.paused_until = 0 # When the lanes last came back from waiting for the rate limit, see throttle
+        # One single-threaded "lane" per worker. A post always goes down the same lane, so its actions happen in the order they were asked for.
+        # PRAW isn't thread safe (nor is the HTTP session under it), so each lane makes its requests through a Reddit instance of its own, from connect().
+        self.lane = threading.local()
+        self.lanes = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"actions-{i}", initializer=self.start_lane, initargs=(connect,)) for i in range(workers)]
+        self.pending = [] # (future, on_done, on_failed) in the order they were submitted
+
+    def start_lane(self, connect):
+        self.lane.reddit = connect()
+        self.lane.heard_at = 0 # When this lane's Reddit instance last had a response, and so the rate limit figures it holds
+
+    def submit(self, post, action, on_done, on_failed=None):
+        # Run action(reddit) for this post, and then on_done(result) - or on_failed() if it raises. "reddit" is the Reddit instance for the thread it runs on.
+        # on_done and on_failed are always run on the main thread (from wait) so that the state store, counters etc. are only ever touched from one thread.
+        if len(self.lanes) == 0:
+            # No workers configured - do it here and now, as the bot always used to
+            try:
+                with self.metrics.phase("writes"):
+                    result = action(self.reddit)
+            except Exception:
+                if on_failed is not None:
+                    on_failed()
+                raise
+            on_done(result)
+            return
+        lane = self.lanes[post.id % len(self.lanes)]
+        self.pending.append((lane.submit(self.run, action), on_done, on_failed))
+
+    def run(self, action):
+        self.throttle(self.lane.reddit)
+        try:
+            with self.metrics.phase("writes"):
+                return action(self.lane.reddit)
+        finally:
+            self.lane.heard_at = time.time()
+
+    def throttle(self, reddit):
+        # Reddit tells us how many requests we have left, and when the count resets, in the X-Ratelimit-Remaining and X-Ratelimit-Reset headers.
+        # PRAW keeps hold of the latest values in reddit.auth.limits. If we're about to run out, hold all the lanes until the reset.
+        # The limit is per account, so it's shared by all the Reddit instances; the lane's own has the latest figures it has seen.
+        # Without the reset time (see seconds_to_rate_limit_reset) we pause for a fixed time instead, and a lane that hasn't heard from Reddit since the
+        # last pause doesn't pause again on the figures it had from before.
+        with self.throttle_lock:
+            limits = reddit.auth.limits
+            if limits.get("remaining") is None:
+                limits = self.reddit.auth.limits # Nothing has gone through this lane yet, so go by the main thread's
+            remaining = limits.get("remaining")
+            if remaining is None or remaining > self.reserve:
+                return
+            if limits.get("reset_timestamp") is None and self.lane.heard_at < self.paused_until:
+                return
+            wait_time = seconds_to_rate_limit_reset(limits, BudgetPlanner.UNKNOWN_RESET_WAIT)
+            print(f"\tRate limit nearly used up ({remaining} requests left) - pausing actions for {wait_time:.0f} seconds")
+            time.sleep(wait_time)
+            self.paused_until = time.time()
+
+    def wait(self):
+        # Wait for everything that has been submitted to finish, and run the on_done for each in the order they were submitted.
+        # An action that fails is reported and skipped (its post hasn't been recorded as done), and its on_failed is run instead.
+        pending, self.pending = self.pending, []
+        for future, on_done, on_failed in pending:
+            try:
+                result = future.result()
+            except Exception as e:
+                print("\n---ERROR in moderation action---\n")
+                print(repr(e))
+                traceback.print_exception(e)
+                if on_failed is not None:
+                    on_failed()
+                continue
+            on_done(result)
+
+
+###############################################################################
+###
+### Rate limit budget -- which work goes first when requests are running short
+###
+###############################################################################
+
+def seconds_to_rate_limit_reset(limits, unknown):
+    # How long until the rate limit window resets, from reddit.auth.limits. PRAW 7 keeps the reset time (from Reddit's X-Ratelimit-Reset header) in
+    # there as "reset_timestamp", but PRAW 8 doesn't, so without it go by "unknown" seconds instead.
+    reset_timestamp = limits.get("reset_timestamp")
+    if reset_timestamp is None:
+        return unknown
+    return max(reset_timestamp - time.time(), 0)
+
+
+class BudgetPlanner:
+    # Kinds of work, most important first
+    ENFORCE = 0      # Acting on posts whose time is up (and reading what we need to do so)
+    REQUEST = 1      # Asking new posts for a submission statement (and finding the new posts)
+    REFRESH = 2      # Re-reading posts that are still waiting, to see if they've been removed
+    SPECULATIVE = 3  # Reads that can happen any time, e.g. catching up on posts from before a restart
+    NAMES = ("enforce", "request", "refresh", "speculative")
+
+    # Number of requests each post costs. Asking for a submission statement: posting the request and pinning it.
+    # Acting on a post once its time is up: reading the comments (and the replies to the request) unless they came from the inbox, then the
+    # response and pinning it, and locking it or removing/reporting the post, and then one each for the request and any replies to it that are removed.
+    REQUEST_COST = 2
+    COMMENTS_COST = 2
+    RESPONSE_COST = 3
+
+    # Reddit's rate limit runs in ten minute windows. Without knowing when the current one resets (see seconds_to_rate_limit_reset), enforcement that
+    # has run out waits UNKNOWN_RESET_WAIT before carrying on; PRAW then holds back any request that would go over the limit until it has reset.
+    WINDOW_SECONDS = 600
+    UNKNOWN_RESET_WAIT = 60
+
+    def __init__(self, reddit, reserve):
+        self.reddit = reddit
+        self.reserve = reserve # Requests always kept back from anything but enforcement
+        self.planned = [0, 0, 0, 0] # Requests we expect each kind of work to need this cycle
+        self.deferred = [0, 0, 0, 0] # Pieces of work put off to a later cycle, since startup
+        self.waited_on = None # The rate limit figures we last waited for a reset on, which are out of date until another request comes back
+
+    def plan(self, priority, requests):
+        # Set aside requests for work that's coming up this cycle, so less important work doesn't use them first
+        self.planned[priority] = requests
+
+    def remaining(self):
+        # Requests left in the current rate limit window, or None if we don't know (nothing sent yet, or we've waited for a reset since) or the window has already reset
+        limits = self.reddit.auth.limits
+        remaining = limits.get("remaining")
+        reset_timestamp = limits.get("reset_timestamp")
+        if remaining is None or (reset_timestamp is not None and reset_timestamp <= time.time()) or limits == self.waited_on:
+            return None
+        return remaining
+
+    def allows(self, priority, requests=1):
+        # Can we afford this work now, leaving enough for everything more important that's planned this cycle? Work that isn't allowed should be
+        # left for a later cycle. Enforcement always goes ahead - if there aren't enough requests left for it, we wait for the rate limit to reset.
+        remaining = self.remaining()
+        if remaining is None:
+            return True
+        if priority == self.ENFORCE:
+            if remaining < requests:
+                wait_time = seconds_to_rate_limit_reset(self.reddit.auth.limits, self.UNKNOWN_RESET_WAIT)
+                print(f"  Rate limit used up ({remaining} requests left) - waiting {wait_time:.0f} seconds for it to reset")
+                time.sleep(wait_time)
+                self.waited_on = self.reddit.auth.limits
+            return True
+        if remaining - requests >= sum(self.planned[:priority]) + self.reserve:
+            return True
+        self.deferred[priority] += 1
+        print(f"  Rate limit low ({remaining} requests left) - putting off {self.NAMES[priority]} work until a later run")
+        return False
+
+
+###############################################################################
+###
+### Listing streams -- reading only what's new since the last poll
+### https://praw.readthedocs.io/en/stable/code_overview/other/util.html#praw.models.util.stream_generator
+###
+###############################################################################
+
+class StreamListing:
+    # Wraps the listing that a PRAW stream polls (subreddit.new, inbox.comment_replies, mod.log).
+    # The stream passes the newest item it has seen as "before", so each poll only returns what has arrived since. But when a poll comes back empty
+    # it drops that cursor (in case the item has gone from the listing, which would return nothing for good), and the next poll just takes the newest
+    # 100 items - as does a fresh stream after one has failed. Anything older than those that arrived in between (a burst after a quiet spell, say)
+    # would be skipped. So a poll without a cursor that doesn't reach anything we've already had carries on back, a page at a time, until it does.
+    MAX_PAGES = 10 # Reddit's listings only go back about 1000 items
+    REMEMBERED = 1000
+
+    def __init__(self, listing, attribute_name="fullname"):
+        self.listing = listing
+        self.attribute_name = attribute_name
+        self.delivered = {} # attribute_name of each item the bot has had -> None, oldest first (a dict as it keeps its order)
+
+    def __call__(self, limit=100, params=None, **kwargs):
+        params = params or {}
+        items = list(self.listing(limit=limit, params=params, **kwargs))
+        if params.get("before") is None and len(self.delivered) > 0:
+            page, page_limit = items, limit
+            for n in range(self.MAX_PAGES - 1):
+                if len(page) < page_limit or any(getattr(item, self.attribute_name) in self.delivered for item in page):
+                    break
+                page, page_limit = list(self.listing(limit=100, params={"after": getattr(page[-1], self.attribute_name)}, **kwargs)), 100
+                items.extend(page)
+        return items
+
+    def delivered_to_bot(self, items):
+        # Only once the bot has actually got them (see drain_stream) - items from a poll that then failed still need to be gone back for
+        for item in items:
+            self.delivered[getattr(item, self.attribute_name)] = None
+        while len(self.delivered) > self.REMEMBERED:
+            del self.delivered[next(iter(self.delivered))]
+
+
 ###############################################################################
 ###
 ### Main worker class -- the bot logic
@@ -246,31 +997,171 @@ class Post:
 ###############################################################################
 
 class Janitor:
-    def __init__(self, subreddit):
-        self.reddit = praw.Reddit(
-                        client_id = cfg['CREDENTIALS']['client_id'],
-                        client_secret = cfg['CREDENTIALS']['client_secret'],
-                        user_agent = "linux:reddit_submission_bot:v1.0",                        
-                        username = cfg['CREDENTIALS']['username'],
-                        password = cfg['CREDENTIALS']['password']
-        )
+    def __init__(self, subreddit_settings, connect=None):
+        self.sub_settings = SSBSettings() # Settings for the bot as a whole (state database, workers etc.) come from DEFAULT. Per-subreddit settings are on each Post.
+        self.metrics = Metrics(self.sub_settings.metrics_port, self.sub_settings.json_logs)
+        # "connect" is only passed in when something other than the live site is wanted, e.g. the fake backend in submission-statement-bot-benchmark.py
+        self.connect = connect or self.connect_to_reddit
+        self.reddit = self.connect()
         self.username = cfg['CREDENTIALS']['username']
-        self.subreddit = self.reddit.subreddit(subreddit)
+        # All the subreddits are read together through one "multireddit" (r/a+b+c), so they share one session, one set of listing requests and one rate limit
+        self.subreddit_settings = subreddit_settings # subreddit name (lower case) -> SSBSettings
+        self.subreddit = self.reddit.subreddit("+".join(settings.subreddit for settings in subreddit_settings.values()))
         self.mod = self.subreddit.mod
         self.submissions = set()
+        self.unclaimed = set() # Other workers' posts, kept to one side in case one of those workers stops and we have to take them over (see take_over_posts)
         self.unmoderated = set()
-        self.checked_submissions = set()
-        self.sub_settings = SSBSettings()
+        self.checked_submissions = {} # submission id (as an int) -> created_utc, for posts we've finished with. Dicts keep insertion order, so the oldest are at the front.
+        self.streams = {} # name -> PRAW stream generator, see drain_stream
+        self.stream_listings = {} # name -> the StreamListing that stream polls, which outlives the stream if it has to be restarted
+        self.posts_by_request_comment = {} # ID of the bot's request comment -> the Post it was made on, so replies in the inbox can be matched up
+        self.cycle = 0
+        self.deadlines = [] # heap of (deadline, submission id, post) - the post with the earliest deadline is always at deadlines[0]
+        self.scheduled = set() # posts that have been requested and are sitting in the deadlines heap
+        self.state = StateStore(self.sub_settings.state_database)
+        self.actions = ActionExecutor(self.reddit, self.sub_settings.action_workers, self.metrics, self.connect)
+        self.budget = BudgetPlanner(self.reddit, self.sub_settings.rate_limit_reserve)
+        self.duplicates = None # Recent submission statements, shared by all the subreddits since spammers don't stick to one
+        if self.sub_settings.duplicate_statement_threshold > 0:
+            self.duplicates = DuplicateStatementIndex(self.sub_settings.duplicate_statement_threshold, self.sub_settings.duplicate_statement_window_hours)
+        self.refreshed = False # Whether every post was refreshed this cycle (see update_submission_list)
         self.startup_time = datetime.now(timezone.utc)
         self.run_start_time = datetime.now(timezone.utc)
         self.action_counter = 0
         self.post_counter = 0
+        self.arrival_rate = 0.0 # New posts per second, as a moving average over recent cycles
+        self.last_fetch_time = None
+        self.newest_created_utc = None # created_utc of the newest post we've picked up, saved so that the next start knows where we got to
+        self.backfill = None # Listing being paged back through for posts made while the bot was down, see start_catch_up
+        self.backfill_after = None
+        self.resumed = False # Whether the posts from the last run have been picked up yet (see update_submission_list)
+
+    def connect_to_reddit(self):
+        # A new Reddit instance. The main loop has one, and so does each of the ActionExecutor's workers, as PRAW isn't thread safe.
+        # PRAW makes its requests through this session, which lets us count them
+        session = requests.Session()
+        session.hooks["response"].append(self.metrics.count_request)
+        return praw.Reddit(
+                    client_id = cfg['CREDENTIALS']['client_id'],
+                    client_secret = cfg['CREDENTIALS']['client_secret'],
+                    user_agent = "linux:reddit_submission_bot:v1.0",                        
+                    username = cfg['CREDENTIALS']['username'],
+                    password = cfg['CREDENTIALS']['password'],
+                    requestor_kwargs = {"session": session}
+        )
+
+    def resume_in_flight_posts(self):
+        # Pick up any posts that were waiting on their deadline when the bot last stopped.
+        # These were all created before startup_time so fetch_submissions would ignore them (#Bug1), but we know exactly what we did to them
+        # from the state store, so there's no need to go looking through their comments to work it out again.
+        rows = self.state.in_flight()
+        if len(rows) == 0:
+            return
+        rows_by_fullname = {"t3_" + row["id"]: row for row in rows}
+        # These are waiting on their deadlines, so reading them comes before anything else (and, with several workers on one account, may have to wait)
+        self.budget.allows(BudgetPlanner.ENFORCE, math.ceil(len(rows) / 100))
+        posts = []
+        for submission in self.reddit.info(fullnames=list(rows_by_fullname)):
+            settings = self.settings_for(submission)
+            if settings is not None:
+                posts.append(Post(submission, settings))
+        # With several workers sharing the state database, only take the posts that are ours (or that a stopped worker has let go of)
+        for post in self.claim(posts):
+            post._post_was_serviced = True
+            post._request_comment_id = rows_by_fullname[post._submission.fullname]["request_comment_id"]
+            # Not tracked through the inbox (see track_request_comment) - OP may well have replied while the bot was stopped
+            self.submissions.add(post)
+            self.schedule_post(post)
+        print(f"Resumed {len(self.scheduled)} post(s) from the state store")
+
+    def start_catch_up(self):
+        # Posts made while the bot was down were created before startup_time, so fetch_submissions ignores them (#Bug1).
+        # If we know how far we'd got last time, page back through the listing to that point (or catch_up_hours, whichever is more recent) and pick them up.
+        # On the very first run there's nothing to catch up on.
+        last_seen = self.state.get_meta("newest_created_utc")
+        if self.sub_settings.catch_up_hours == 0 or last_seen is None:
+            return
+        self.newest_created_utc = float(last_seen)
+        self.backfill_after = max(self.newest_created_utc, time.time() - self.sub_settings.catch_up_hours * 3600)
+        self.backfill = iter(self.subreddit.new(limit=None))
+        print("Catching up on posts made since " + datetime.fromtimestamp(self.backfill_after, tz=timezone.utc).strftime("%Y-%m-%d, %H:%M:%S") + " UTC")
+
+    def catch_up(self):
+        # Take the next page (100 posts, one request) of the catch-up listing. Only one page per cycle, so that a long backlog doesn't hold up the posts
+        # arriving now. Returns the posts that need handling, which from here on are treated the same as new ones.
+        if self.backfill is None:
+            return set()
+        startup_timestamp = self.startup_time.timestamp()
+        caught_up = set()
+        for n in range(100):
+            submission = next(self.backfill, None)
+            if submission is None or submission.created_utc <= self.backfill_after:
+                print("Caught up on posts made while the bot was stopped")
+                self.backfill = None
+                break
+            if submission.created_utc >= startup_timestamp:
+                continue # fetch_submissions has this one
+            settings = self.settings_for(submission)
+            if settings is None or submission.removed or int(submission.id, 36) in self.checked_submissions:
+                continue
+            post = Post(submission, settings)
+            if post not in self.submissions and post not in self.unclaimed: # Not already resumed from the state store
+                post.restart_clock()
+                caught_up.add(post)
+        return caught_up
+
+    def owns_shard(self, post):
+        # Posts are shared out between the workers by their ID
+        return post.id % self.sub_settings.worker_count == self.sub_settings.worker_index
+
+    def claim(self, posts):
+        # With worker_count above 1, several copies of the bot share the subreddit(s), and a post is only handled by the worker holding its lease in
+        # the shared state database. A worker claims the posts in its own shard straight away. It only tries for another worker's posts once they're
+        # older than lease_seconds, by which time the owner would have claimed them (and keeps renewing the lease while it's alive) - so the posts
+        # of a worker that has stopped are picked up by the others once its leases run out. Returns the posts this worker now holds.
+        settings = self.sub_settings
+        if settings.worker_count == 1:
+            return posts
+        now = time.time()
+        candidates = [post for post in posts if self.owns_shard(post) or post._submission.created_utc + settings.lease_seconds < now]
+        if len(candidates) == 0:
+            return []
+        claimed = self.state.claim([post._submission.id for post in candidates], settings.worker_index, now + settings.lease_seconds)
+        return [post for post in candidates if post._submission.id in claimed]
+
+    def renew_leases(self):
+        # Keep hold of the posts we're tracking, so that the other workers know we're still going
+        if self.sub_settings.worker_count > 1 and len(self.submissions) > 0:
+            tracked = [post._submission.id for post in self.submissions if post._submission is not None]
+            self.state.renew(tracked, self.sub_settings.worker_index, time.time() + self.sub_settings.lease_seconds)
+
+    def track(self, posts):
+        # Start tracking these posts - or with several workers, the ones we've claimed. Everything the bot does to a tracked post (state store writes
+        # included) assumes we hold its lease, so the rest are left with the worker that has them, and kept to one side in case it stops.
+        claimed = set(self.claim(list(posts)))
+        self.submissions = self.submissions.union(claimed) 
+        # We're adding to this list to ensure that we don't lose anything if there's a big influx of posts. Union prevents duplicates, but as per #Bug3 this doesnt remove duplicate Reddit submissions. Why? 
+        # Because items in self.submissions are objects of type Post, and each one of these is a different wrapper even if the actual Reddit content is the same. As such we have to utilise the "eq" method within the Post class to allow a comparison.
+        self.unclaimed |= posts - claimed
+
+    def take_over_posts(self):
+        # Claim any of the other workers' posts that a stopped worker has let go of (see claim), and track them from now on.
+        # Anything that worker had already finished with is let go of too once it has finished, and is found in the state store (see request_submission_statement).
+        if len(self.unclaimed) == 0:
+            return
+        window_timestamp = time.time() - self.sub_settings.tracking_window_hours * 3600
+        self.unclaimed = {post for post in self.unclaimed if post._submission.created_utc > window_timestamp and post.id not in self.checked_submissions}
+        unclaimed, self.unclaimed = self.unclaimed, set()
+        self.track(unclaimed)
+
+    def settings_for(self, submission):
+        # Route a submission to the settings for the subreddit it was posted in. None if it isn't one of ours.
+        return self.subreddit_settings.get(submission.subreddit.display_name.lower())
 
     def submission_statement_quote_text(self, ss, spoilers):
         # Construct the quoted message, by quoting OP's submission statement
 
         verbiage = f"The following submission statement was provided by u/{ss.author}:\n\n---\n\n"
-        #WARNING: the text phrase "submission statement was provided" is used as a verification of a bot reply later in the code (in the "submission_statement_previously_validated" function). Do not change the above line in isolation.
          
         if(spoilers):
             quote_text = ss.body.replace("\n\n", "!<\n\n>!") # Need to be able to handle line breaks in the Reddit format, as spoiler tags don't carry over.
@@ -281,159 +1172,533 @@ class Janitor:
         return verbiage
 
 
-    def refresh_posts(self):
+    def refresh_posts(self, posts):
         # If we want to check if post.removed or post.approved, in order to do this, must refresh running list. No need to check the queue or query again
-        for post in self.submissions:
-            post.refresh(self.reddit)
-
-
-    def fetch_submissions(self, type="new"): 
+        # Rather than fetching every post (and its comments) one at a time, ask /api/info about all of them at once - PRAW sends up to 100 fullnames per request.
+        posts_by_fullname = {post._submission.fullname: post for post in posts}
+        if len(posts_by_fullname) == 0:
+            return
+        for submission in self.reddit.info(fullnames=list(posts_by_fullname)):
+            posts_by_fullname[submission.fullname].refresh(submission)
+
+
+    def drain_stream(self, name, listing, attribute_name="fullname"):
+        # Drain whatever the named PRAW stream (of the given listing) has for us right now.
+        # A stream keeps a cursor (the fullname of the newest item it has seen) and passes it to Reddit as the "before" parameter, so each poll
+        # only returns items that have arrived since the last one, instead of the whole listing. The streams are started with pause_after=-1, 
+        # which makes them hand back None after each request so that we can stop and get on with the rest of the cycle.
+        if self.streams.get(name) is None:
+            if name not in self.stream_listings:
+                self.stream_listings[name] = StreamListing(listing, attribute_name)
+            self.streams[name] = praw.models.util.stream_generator(self.stream_listings[name], pause_after=-1, attribute_name=attribute_name)
+
+        items = []
+        batch = 0
+        try:
+            for item in self.streams[name]:
+                if item is None:
+                    # A full batch (PRAW asks for 100 at a time) means there could be more waiting behind it, e.g. after a burst of posts, so go round again
+                    if batch < 100:
+                        break
+                    batch = 0
+                    continue
+                items.append(item)
+                batch += 1
+        except Exception:
+            # A generator that has raised is finished for good, so throw it away and start a fresh stream next time around.
+            # The fresh stream has no cursor and will return the latest items again (going back as far as the last ones we got, see StreamListing),
+            # but anything we've already got is deduped by the caller.
+            self.streams[name] = None
+            raise
+        self.stream_listings[name].delivered_to_bot(items)
+        return items
+
+    def read_submission_stream(self):
+        return self.drain_stream("submissions", self.subreddit.new)
+
+    def read_inbox_replies(self):
+        # OP's submission statement is a reply to the bot's request comment, so Reddit puts it in the bot's inbox for us.
+        # Attach each reply to the post it belongs to as it arrives, and we never need to go looking through the comments for it.
+        replies = self.drain_stream("inbox", self.reddit.inbox.comment_replies)
+        for reply in replies:
+            post = self.posts_by_request_comment.get(reply.parent_id[3:]) # parent_id is a fullname, "t1_" + comment ID
+            if post is not None:
+                post.add_request_reply(reply)
+
+    def read_mod_log(self):
+        # Instead of refreshing every post we're tracking to see whether a moderator has removed it, read what the moderators have done since last time.
+        # This is one cheap request per cycle however many posts are waiting.
+        actions = self.drain_stream("modlog", self.subreddit.mod.log, attribute_name="id")
+        if len(actions) == 0:
+            return
+        posts_by_fullname = {post._submission.fullname: post for post in self.submissions if not post._submission_statement_checked}
+        for action in actions:
+            post = posts_by_fullname.get(action.target_fullname)
+            if post is None or (action.mod is not None and str(action.mod).lower() == self.username.lower()):
+                # Not a post we're waiting on, or something the bot did itself
+                continue
+            if action.action in ("removelink", "spamlink"):
+                print(f"  Post removed by u/{action.mod} - no longer tracking\n\t{post._submission.permalink}")
+            elif action.action == "approvelink" and post.settings.moderator_approval_exempts:
+                print(f"  Post approved by u/{action.mod} - no submission statement needed\n\t{post._submission.permalink}")
+            else:
+                continue
+            self.state.record(post, StateStore.EXEMPT)
+            self.mark_checked(post)
+            del posts_by_fullname[action.target_fullname]
+
+    def track_request_comment(self, post):
+        # Replies to this post's request comment will come to us through the inbox from now on.
+        # Only for requests this process has just made: the inbox stream only starts from the newest replies when the bot starts, so replies to a request
+        # made before then (by an earlier run, or by another worker) may be long gone from it. Those posts read the request comment's replies instead.
+        if self.sub_settings.use_inbox_replies and post._request_comment_id is not None:
+            if post._request_replies is None:
+                post._request_replies = []
+            self.posts_by_request_comment[post._request_comment_id] = post
+
+    def refresh_request_replies(self, posts):
+        # Replies in the inbox are as they were when they arrived. Before we judge them, get the latest versions (in case they've been edited or deleted) in one batched call.
+        replies_by_fullname = {}
+        for post in posts:
+            if post._request_replies:
+                for reply in post._request_replies:
+                    replies_by_fullname[reply.fullname] = post
+        if len(replies_by_fullname) == 0:
+            return
+        # The inbox won't give us these replies again, so the posts keep the ones they have until the new versions are all in - if the call fails,
+        # the next try judges them on what we had rather than on nothing
+        refreshed = {post: [] for post in replies_by_fullname.values()}
+        for reply in self.reddit.info(fullnames=list(replies_by_fullname)):
+            refreshed[replies_by_fullname[reply.fullname]].append(reply)
+        for post, replies in refreshed.items():
+            post._request_replies = []
+            for reply in replies:
+                post.add_request_reply(reply)
+
+    def fetch_submissions(self, type="stream"): 
         # get the latest list of submissions to the subreddit
         self.run_start_time = datetime.now(timezone.utc)
         print("Fetching new submissions. Time now is: " + datetime.now(timezone.utc).strftime("%Y-%m-%d, %H:%M:%S") + " UTC") #Bug1
         submissions = set()
-        if (type == "new") :
+        if (type == "stream") :
+            newposts = self.read_submission_stream()
+            # Only posts we haven't seen before come back from the stream, so the cost of this step depends on how many new posts there are and not on the size of the listing.
+        elif (type == "new") :
             newposts = self.subreddit.new()
             # Was originally going to use subreddit.top but this doesn't return posts immediately when they're submitted for some reason - it takes time for Reddit to register them in the "top" list I suspect. So instead we use subreddit.new even though this will give a larger list of results to process.
-            # Possibility we could limit the number of posts retrieved, but how would we know where to put that limit? Default is 1000 posts. As such adding this as the default choice if nothing is specified.
+            # Possibility we could limit the number of posts retrieved, but how would we know where to put that limit? Default is 1000 posts. This was the default choice before the stream was added above, and can still be selected with type="new".
         else :
             newposts = self.subreddit.top(time_filter="day")
 
         # Add each post into our wrapper class
-        startup_timestamp = time.mktime(self.startup_time.timetuple())
+        startup_timestamp = self.startup_time.timestamp()
+        window_timestamp = time.time() - self.sub_settings.tracking_window_hours * 3600
         for post in newposts:
-            if post.created_utc > startup_timestamp: # Ignore posts created before the bot was started
-                submissions.add(Post(post))
-
-        # Remove anything we've already seen #Bug2
-        submissions = submissions - self.checked_submissions
+            if post.created_utc > startup_timestamp and post.created_utc > window_timestamp: # Ignore posts created before the bot was started, or that are too old to track
+                # Skip anything we've already seen #Bug2 - checked before wrapping, so we don't build a Post just to throw it away
+                settings = self.settings_for(post)
+                if settings is not None and int(post.id, 36) not in self.checked_submissions:
+                    submissions.add(Post(post, settings))
 
         return submissions
 
+    def mark_checked(self, post):
+        # We're done with this post. Remember its ID so it doesn't get picked up again, and drop everything else.
+        post._submission_statement_checked = True
+        self.checked_submissions[post.id] = post._submission.created_utc
+        self.submissions.discard(post)
+        self.posts_by_request_comment.pop(post._request_comment_id, None)
+        post.release()
+
+    def forget_old_submissions(self):
+        # fetch_submissions ignores anything older than the tracking window, so once a checked post falls outside the window there's no need to remember it.
+        # This stops checked_submissions growing forever on a long-running bot.
+        # Posts are checked in (roughly) deadline order so the oldest are at the front; one that's slightly out of order just hangs around a little longer.
+        window_timestamp = time.time() - self.sub_settings.tracking_window_hours * 3600
+        while len(self.checked_submissions) > 0:
+            oldest_id = next(iter(self.checked_submissions))
+            if self.checked_submissions[oldest_id] > window_timestamp:
+                break
+            del self.checked_submissions[oldest_id]
+        self.state.forget_before(window_timestamp)
+
+    def drop_removed_post(self, post):
+        # A moderator removed the post, or its author deleted it, before its time ran out - there's nothing more to do with it.
+        # Record that in the state store too, or a restart would pick it up again as still waiting on its submission statement.
+        self.state.record(post, StateStore.EXEMPT)
+        self.mark_checked(post)
 
     def update_submission_list(self): 
         # get the latest posts and remove any we don't need to deal with
 
-        retrieved_submissions = self.fetch_submissions()
-        self.submissions = self.submissions.union(retrieved_submissions) 
-        # We're adding to this list to ensure that we don't lose anything if there's a big influx of posts. Union prevents duplicates, but as per #Bug3 this doesnt remove duplicate Reddit submissions. Why? 
-        # Because items in self.submissions are objects of type Post, and each one of these is a different wrapper even if the actual Reddit content is the same. As such we have to utilise the "eq" method within the Post class to allow a comparison.
-
-        # Refresh all the posts we have in the list to ensure their status is correct (primarily we're concerned about "removed")
-        self.refresh_posts()
+        # New cycle, so any comment snapshots from the last one are out of date
+        self.cycle += 1
+        Post.cycle = self.cycle
+
+        # Pick up where the last run left off. This is done here rather than when the Janitor is made, as it needs Reddit,
+        # and if Reddit is down then the main loop will try again next cycle.
+        if not self.resumed:
+            self.resume_in_flight_posts()
+            self.start_catch_up()
+            self.resumed = True
+
+        # Keep back enough of the rate limit for the posts that are due, before anything else gets a look in
+        now = datetime.now(timezone.utc)
+        self.budget.plan(BudgetPlanner.ENFORCE, sum(self.enforcement_cost(post) for deadline, submission_id, post in self.deadlines if deadline <= now))
+
+        with self.metrics.phase("fetch"), self.metrics.timed("fetch_submissions"):
+            retrieved_submissions = self.fetch_submissions()
+            # Into the list straight away - the stream has moved on past these posts, so if anything below fails they'd never come back from it
+            self.track(retrieved_submissions)
+            self.update_arrival_rate(len(retrieved_submissions))
+            for post in retrieved_submissions:
+                if self.newest_created_utc is None or post._submission.created_utc > self.newest_created_utc:
+                    self.newest_created_utc = post._submission.created_utc
+            if self.sub_settings.use_inbox_replies:
+                self.read_inbox_replies()
+            if self.backfill is not None and self.budget.allows(BudgetPlanner.SPECULATIVE):
+                self.track(self.catch_up())
+
+        self.forget_old_submissions()
+
+        # Then the requests for the new posts
+        new_posts = sum(1 for post in self.submissions if post not in self.scheduled and not post._submission_statement_checked)
+        self.budget.plan(BudgetPlanner.REQUEST, BudgetPlanner.REQUEST_COST * new_posts)
+
+        # If the rate limit is running short, the refresh can wait; the posts that are due are refreshed on their own instead (in handle_due_and_new_posts)
+        self.refreshed = False
+        if self.sub_settings.use_mod_log:
+            # The mod log tells us which posts other moderators have removed, so only the posts that are due get refreshed (in handle_due_and_new_posts)
+            if self.budget.allows(BudgetPlanner.REFRESH):
+                with self.metrics.phase("fetch"), self.metrics.timed("read_mod_log"):
+                    self.read_mod_log()
+        elif self.budget.allows(BudgetPlanner.REFRESH, math.ceil(len(self.submissions) / 100)):
+            # Refresh all the posts we have in the list to ensure their status is correct (primarily we're concerned about "removed")
+            with self.metrics.phase("refresh"), self.metrics.timed("refresh_posts"):
+                self.refresh_posts(self.submissions)
+            self.refreshed = True
 
         # Iterate through the submissions list, mark anything we need to remove and then remove it.
         submissions_to_remove = set()
+        removed_posts = []
         for post in self.submissions:
-            if post._submission.removed or post._submission_statement_checked: #Bug2
+            if post._submission_statement_checked: #Bug2
                 submissions_to_remove.add(post)
+            elif post.is_deleted() or (post._submission.removed and post._enforcement is None): # (not if the bot removed it itself, with more actions to go)
+                removed_posts.append(post)
+        for post in removed_posts:
+            self.drop_removed_post(post)
 
         # Can't "live" remove items from self.submissions otherwise we'll hit a "Set changed size during iteration" error, so remove afterwards
         self.submissions = self.submissions - submissions_to_remove
-
-    def remove_or_report_post(self, post, mod_note):
+        for post in submissions_to_remove:
+            self.posts_by_request_comment.pop(post._request_comment_id, None)
+
+    def update_arrival_rate(self, new_posts):
+        # Keep a moving average of how quickly posts are arriving, which wait_time uses to decide how often to check for more
+        now = time.time()
+        if self.last_fetch_time is not None and now > self.last_fetch_time:
+            self.arrival_rate = 0.7 * self.arrival_rate + 0.3 * (new_posts / (now - self.last_fetch_time))
+        self.last_fetch_time = now
+
+    def wait_time(self):
+        # How long to wait before the next cycle.
+        # With adaptive polling the bot wakes up for the next deadline rather than sleeping through it, checks for new posts about as often
+        # as they're arriving, and backs off to bot_max_interval when things are quiet - all within bot_min_interval..bot_max_interval,
+        # and slowed down further if the rate limit won't stretch to the time until it resets.
+        settings = self.sub_settings
+        if not settings.adaptive_polling:
+            return settings.bot_interval
+
+        now = time.time()
+        if self.arrival_rate > 0:
+            wait = 1 / self.arrival_rate # About the time until the next post arrives
+        else:
+            wait = settings.bot_max_interval
+        if len(self.deadlines) > 0:
+            wait = min(wait, self.deadlines[0][0].timestamp() - now + 1) # A second past the next deadline, so it has definitely expired
+        wait = min(max(wait, settings.bot_min_interval), settings.bot_max_interval)
+
+        # If a cycle like the last one, repeated every "wait" seconds, would use up the rate limit before it resets then spread the cycles out
+        # (Without the reset time, assume the worst - that the whole window is still to go)
+        limits = self.reddit.auth.limits
+        remaining = limits.get("remaining")
+        cycle_cost = self.metrics.last_cycle_requests
+        if remaining is not None and cycle_cost > 0:
+            seconds_to_reset = seconds_to_rate_limit_reset(limits, BudgetPlanner.WINDOW_SECONDS)
+            budget_wait = seconds_to_reset * cycle_cost / max(remaining, 1)
+            wait = max(wait, min(budget_wait, seconds_to_reset))
+        return round(wait)
+
+    def remove_or_report_post(self, reddit, post, mod_note, request_comment=None):
         # depending on the config setting, we can remove the post, or just report it
-        if self.sub_settings.remove_posts:
-            post.remove_post(self.sub_settings.removal_reason, mod_note)
+        # (request_comment is the bot's request comment when it's being edited into the notice, see enforce_submission_statement)
+        if post.settings.remove_posts:
+            post.remove_post(reddit, post.settings.removal_reason, mod_note, request_comment)
             print(f"\tRemoving post: \n\t\t{post._submission.title}\n\t\t{post._submission.permalink}")
             print(f"\tReason: {mod_note}\n---\n")
         else:                            
-            post.report_post(self.sub_settings.report_reason, mod_note)
+            post.report_post(reddit, post.settings.report_reason, mod_note, request_comment)
             print(f"\tReporting post: \n\t\t{post._submission.title}\n\t\t{post._submission.permalink}")
             print(f"\tReason: {mod_note}\n---\n")
-        self.action_counter += 1 #Bug4
     
-    def required_words_in_submission_statement(self, post):        
-        # check for words from the config list within the ss
-        if len(self.sub_settings.required_words) > 0:
-            for word in self.sub_settings.required_words:                            
-                if word not in post._submission_statement.body:
-                    return False
-            print(f"\tSS has required word(s) \n\t{post._submission.permalink}")
-        return True
+    def schedule_post(self, post):
+        # Put the post on the deadline heap so that we don't have to look at it again until its time is up
+        heapq.heappush(self.deadlines, (post.deadline(), post._submission.id, post))
+        self.scheduled.add(post)
+
+    def request_submission_statement(self, post):
+        # First sight of a post - ask for a submission statement if we haven't already, and schedule the check for when the time runs out.
+        # This is the only point at which a waiting post costs us anything; after this it sits on the heap until it's due.
+        print(f"  Checking post: {post._submission.title}\n\t{post._submission.permalink}...")
+
+        # If the state store knows about this post then it can tell us what we've done already, without reading any comments
+        known = self.state.get(post._submission.id)
+        if known is not None:
+            post._request_comment_id = known["request_comment_id"]
+            post._post_was_serviced = True
+            if known["state"] != StateStore.REQUESTED:
+                print("\tPost already handled (" + known["state"] + ")")
+                self.mark_checked(post)
+                return
+            print("\tSubmission statement already requested")
+            # We've asked already, so all that's left is to check the SS once the time is up
+            self.schedule_post(post)
+            return
+
+        if post._submission.distinguished:
+            # A moderator post made in "official capacity" - there's nothing for us to do with it (see candidate_submission_statement)
+            print("\tPost is distinguished - ignoring")
+            self.mark_checked(post)
+            return
+
+        # Every request we make is recorded in the state store (see request_made), so if it has no row for the post then we've never been here,
+        # and there's no need to read the comments to find out
+        print("\tNew post - requesting submission statement from user")
+        if not self.owns_shard(post):
+            # Another worker's post that was never asked about (see claim), so the user gets the full time limit from now
+            post.restart_clock()
+        # Here we have to request the submission statement from the author, and move on
+        text = "###Submission Statement Request\n\n" + post.settings.submission_statement_request_text
+        self.actions.submit(post, 
+                            lambda reddit: post.reply_to_post(reddit, text, pin=post.settings.pin_submission_statement_request, lock=False, name="request"),
+                            lambda request_comment: self.request_made(post, request_comment))
+
+    def request_made(self, post, request_comment):
+        # The request comment is up - record it, and schedule the check for when the time runs out
+        post._request_comment_id = request_comment.id
+        post._post_was_serviced = True
+        post._writes = None
+        self.track_request_comment(post)
+        self.post_counter += 1
+        self.state.record(post, StateStore.REQUESTED)
+        self.schedule_post(post)
+
+    def enforce_submission_statement(self, post):
+        # The time has expired on this post, so check the submission statement and take action
+        print(f"  Checking post: {post._submission.title}\n\t{post._submission.permalink}...")
+        print("\tTime has expired - taking action")
+
+        if post._enforcement is not None:
+            # Its actions didn't all go through last time. What was decided then stands - OP's submission statement may have gone since, along with
+            # the bot's request - so carry on from the write that failed
+            print("\tTrying the rest of the actions again")
+            take_action, writes = post._enforcement
+            post._submission_statement_checked = True # As below
+            self.budget.allows(BudgetPlanner.ENFORCE, writes - len(post._writes or ()))
+            self.actions.submit(post, take_action, lambda result: self.enforcement_done(post), lambda: self.enforcement_failed(post))
+            return
+
+        if post._request_replies is None:
+            self.budget.allows(BudgetPlanner.ENFORCE, BudgetPlanner.COMMENTS_COST)
+
+        # Find the submission statement (if there is one) before anything else, while the bot's request comment and its replies are still there to be read
+        has_submission_statement = post.candidate_submission_statement(self.username)
+        if has_submission_statement and post._submission_statement is None:
+            # The post has been distinguished since we asked for a submission statement, so it's now treated as a moderator post and left alone
+            self.state.record(post, StateStore.VALIDATED)
+            self.mark_checked(post)
+            return
+
+        # Work out which of the bot's comments need to go. That's all reading, so it's done here rather than along with the actions below.
+        request_comment = None
+        replies_to_remove = []
+        edit_in_place = post.settings.edit_request_comment_in_place
+        if edit_in_place:
+            # The request comment becomes the response, so it stays where it is (stickied), and so do the replies to it - they're answers to it,
+            # and if the post is being removed they go with it anyway. Fall back to a new comment if we can't find the request.
+            if post._request_comment_id is not None:
+                request_comment = self.reddit.comment(post._request_comment_id)
+            else:
+                request_comment = post.find_request_comment(self.username)
+        elif post.settings.remove_request_comment and post._request_replies is not None:
+            # We've had the replies from the inbox, so we already know everything we need to remove without reading the comments
+            replies_to_remove = post._request_replies
+            request_comment = self.reddit.comment(post._request_comment_id)
+        elif post.settings.remove_request_comment:
+            request_comment = post.find_request_comment(self.username) # Read from this cycle's comment snapshot, so no extra fetch
+            if request_comment is not None:
+                # found the bot's request for a SS
+                # Remove all the comment's replies and delete the bot comment
+                replies_to_remove = request_comment.replies.list() # .list(): Return a flattened list of all comments. (awesome - no recursion needed!)
+    
+        # Check if there is a submission statement                
+        mod_note = None
+        if has_submission_statement:
+            print("\tPost has submission statement")                    
+
+            # Does the submission statement have the required length, and the required words if there are any set in the config?
+            # If not, report or remove depending on subreddit settings
+            mod_note = post.settings.validator.validate(post._submission_statement)
+            if mod_note is None:
+                print("\tSS has proper length")
+                if len(post.settings.required_words) > 0:
+                    print(f"\tSS has required word(s) \n\t{post._submission.permalink}")
+
+            # Is it a copy of another user's recent submission statement?
+            if mod_note is None and self.duplicates is not None:
+                ss = post._submission_statement
+                duplicate = self.duplicates.match(ss.body, str(ss.author).lower(), post._submission.permalink)
+                if duplicate is not None:
+                    print(f"\tSS is {duplicate[0]:.0%} the same as another user's submission statement\n\t{duplicate[1]}")
+                    mod_note = "Submission statement copies another user's submission statement"
 
-    def handle_posts(self):
-        print("Handling posts")
-        
-        print("  "+str(len(self.submissions)) + " submissions to check")
-        for post in self.submissions:
-            print(f"  Checking post: {post._submission.title}\n\t{post._submission.permalink}...")
+        else:
+            print("\tPost does NOT have submission statement")
 
-            if post.submission_statement_previously_validated(self.username): 
-                # Skip posts that we've already validated
-                print("\tSubmission statement already validated")
-                continue
+            # Report / Remove                
+            mod_note = "No submission statement provided"
 
-            if not post.serviced_by_janitor(self.username):
-                print("\tNew post - requesting submission statement from user")
-                # Here we have to request the submission statement from the author, and move on
-                text = "###Submission Statement Request\n\n" + self.sub_settings.submission_statement_request_text
-                post.reply_to_post(text, pin=self.sub_settings.pin_submission_statement_request, lock=False)
-                post._post_was_serviced = True
-                self.post_counter += 1
-                continue
+        post._submission_statement_valid = mod_note is None
+        post._submission_statement_checked = True # Decided - so it isn't picked up as a new arrival while the actions below are still going through
+
+        def take_action(reddit):
+            # (the comments are looked up again through "reddit", the instance this is running with - see reply_to_post)
+            comment_to_edit = reddit.comment(request_comment.id) if edit_in_place and request_comment is not None else None
 
+            if mod_note is None:
+                # We need to post the submission statement response.                         
+                response_comment = post.respond(reddit, self.submission_statement_quote_text(post._submission_statement, post.settings.submission_reply_spoiler), pin=post.settings.pin_submission_statement_response, lock=True, request_comment=comment_to_edit)
+                post._response_comment_id = response_comment.id
             else:
-                print("\tSubmission statement already requested")    
-                # We've interacted with this post before, so can check the SS          
-
-            # So at this point the post hasn't had the SS validated.
-
-            # First let's see if we need to do anything
-            if post.has_time_expired(self.sub_settings.submission_statement_time_limit_minutes):
-                print("\tTime has expired - taking action")
-
-                # Remove original comment by the bot
-                if self.sub_settings.remove_request_comment:
-                    for top_level_comment in post._submission.comments:
-                            if top_level_comment.author is not None and top_level_comment.author.name == cfg['CREDENTIALS']['username'] and "Submission Statement Request" in top_level_comment.body: 
-                                # Do not use "is" as that compares in-memory objects to be the same object, use == for value comparison
-
-                                # found the bot's request for a SS
-                                # Remove all the comment's replies and delete the bot comment
-                                post._submission.comments.replace_more() # Resolves the "More comments" text to get all comments
-                                for comment in top_level_comment.replies.list():
-                                    # .list(): Return a flattened list of all comments. (awesome - no recursion needed!)
-                                    comment.mod.remove()
-                                top_level_comment.delete()
-            
-                # Check if there is a submission statement                
-                if post.candidate_submission_statement():
-                    print("\tPost has submission statement")                    
-
-                    # Does the submission statement have the required length?
-                    # If not, report or remove depending on subreddit settings
-                    if not len(post._submission_statement.body) >= self.sub_settings.submission_statement_minimum_char_length:
-                        mod_note = "Submission statement is too short"
-                        self.remove_or_report_post(post, mod_note)
-                                            
-                    # Check for required words in the post if there are any set in the config
-                    # If one of the words isn't found, remove/report the post depending on subreddit settings
-                    elif not self.required_words_in_submission_statement(post):
-                        mod_note = "Submission statement does not contain the requisite words"
-                        self.remove_or_report_post(post, mod_note)
-                                            
-                    else:                        
-                        print("\tSS has proper length")
-
-                        # We need to post the submission statement response.                         
-                        post.reply_to_post(self.submission_statement_quote_text(post._submission_statement, self.sub_settings.submission_reply_spoiler), pin=self.sub_settings.pin_submission_statement_response, lock=True)                        
-                        post._submission_statement_valid = True
-                        print("\tSubmission statement validated")
+                self.remove_or_report_post(reddit, post, mod_note, comment_to_edit)
+
+            # Then remove original comment by the bot (unless it's been edited into the response). This comes last so that if the bot is stopped part way
+            # through, OP's submission statement is still there for it to find when it comes back.
+            for comment in replies_to_remove:
+                post.write_once("remove " + comment.id, lambda: reddit.comment(comment.id).mod.remove())
+            if request_comment is not None and not edit_in_place:
+                post.write_once("delete request", lambda: reddit.comment(request_comment.id).delete())
+
+        # Now we know exactly what's to be done, make sure there are enough requests left for all of it
+        writes = BudgetPlanner.RESPONSE_COST + len(replies_to_remove) + (1 if request_comment is not None and not edit_in_place else 0)
+        self.budget.allows(BudgetPlanner.ENFORCE, writes)
+        post._enforcement = (take_action, writes)
+        self.actions.submit(post, take_action, lambda result: self.enforcement_done(post), lambda: self.enforcement_failed(post))
+
+    def enforcement_cost(self, post):
+        # Roughly how many requests acting on this post will take (see BudgetPlanner), from what we know before reading its comments
+        cost = BudgetPlanner.RESPONSE_COST
+        if post._request_replies is None:
+            cost += BudgetPlanner.COMMENTS_COST
+        if post.settings.remove_request_comment and not post.settings.edit_request_comment_in_place:
+            cost += 1 + len(post._request_replies or ())
+        return cost
+
+    def enforcement_failed(self, post):
+        # Some of the post's actions didn't go through. Keep tracking it, and have another go once this cycle is over (its deadline has passed,
+        # so it's due straight away) - see the top of enforce_submission_statement.
+        post._submission_statement_checked = False
+        self.schedule_post(post)
+
+    def enforcement_done(self, post):
+        # The actions for an expired post have all gone through - record the outcome and we're done with it
+        self.metrics.enforcement_lag((datetime.now(timezone.utc) - post.deadline()).total_seconds())
+        if post._submission_statement_valid:
+            print(f"\tSubmission statement validated\n\t{post._submission.permalink}")
+            self.state.record(post, StateStore.VALIDATED)
+        else:
+            self.action_counter += 1 #Bug4
+            if post.settings.remove_posts:
+                self.state.record(post, StateStore.REMOVED)
+            else:
+                self.state.record(post, StateStore.REPORTED)
+        self.mark_checked(post)
 
-                else:
-                    print("\tPost does NOT have submission statement")
+    def handle_posts(self):
+        # Anything read from Reddit in here is counted as a comment read (the replies to due posts are counted as a refresh); the writes are counted by the ActionExecutor
+        with self.metrics.phase("comments"), self.metrics.timed("handle_posts"):
+            self.handle_due_and_new_posts()
+        self.metrics.end_cycle(self)
 
-                    # Report / Remove                
-                    mod_note = "No submission statement provided"
-                    self.remove_or_report_post(post, mod_note)                                                                       
-                    post._submission_statement_valid = False
-                              
-                self.checked_submissions.add(post)
-                post._submission_statement_checked = True
+    def handle_due_and_new_posts(self):
+        print("Handling posts")
+        
+        print("  "+str(len(self.submissions)) + " submissions to check")
 
-            else:
-                print("\tTime has not expired - skipping post")
+        self.renew_leases()
+
+        # Deal with the posts whose time is up first. Anything at the top of the heap that has gone past its deadline is due.
+        # This happens before we look at new arrivals so that a post is never requested and enforced in the same cycle.
+        due_posts = []
+        while len(self.deadlines) > 0 and self.deadlines[0][2].has_time_expired():
+            deadline, submission_id, post = heapq.heappop(self.deadlines)
+            self.scheduled.discard(post)
+            if post not in self.submissions:
+                # Dropped from the list since it was scheduled (removed by a moderator, deleted etc.) - nothing to do
+                continue
+            due_posts.append(post)
+
+        # We should still hold the leases on these, but not if we've been stalled long enough for another worker to take them over
+        claimed = set(self.claim(due_posts))
+        for post in [post for post in due_posts if post not in claimed]:
+            print(f"  Post taken over by another worker\n\t{post._submission.permalink}")
+            due_posts.remove(post)
+            self.submissions.discard(post)
+            self.posts_by_request_comment.pop(post._request_comment_id, None)
+
+        with self.metrics.phase("refresh"):
+            if not self.refreshed and len(due_posts) > 0:
+                # Posts aren't refreshed every cycle when we're reading the mod log (or the refresh was put off), so get the latest version of the due ones
+                # before judging them (removed, deleted by their author, or distinguished since, say)
+                self.refresh_posts(due_posts)
+                for post in [post for post in due_posts if post.is_deleted() or (post._submission.removed and post._enforcement is None)]:
+                    due_posts.remove(post)
+                    self.drop_removed_post(post)
+            self.refresh_request_replies(due_posts)
+        for post in due_posts:
+            self.enforce_submission_statement(post)
+        self.budget.plan(BudgetPlanner.ENFORCE, 0)
+
+        # Then anything we haven't seen before, including any posts we're taking over from a stopped worker
+        # (iterating over a copy, as posts that turn out to be finished with are taken out of self.submissions as we go)
+        # Oldest first, so if the rate limit runs short it's the posts that have waited longest that get asked; the rest are left for the next run
+        self.take_over_posts()
+        new_posts = [post for post in self.submissions if post not in self.scheduled and not post._submission_statement_checked and post.id not in self.checked_submissions]
+        claimed = set(self.claim(new_posts))
+        for post in [post for post in new_posts if post not in claimed]:
+            # We've been stalled long enough for another worker to take it over, so it's theirs now
+            self.submissions.discard(post)
+            self.unclaimed.add(post)
+        for post in sorted(claimed, key=lambda post: post.deadline()):
+            if not self.budget.allows(BudgetPlanner.REQUEST, BudgetPlanner.REQUEST_COST):
+                break
+            self.request_submission_statement(post)
+
+        # Wait for the moderation actions from this cycle to finish, so everything is recorded before the next one
+        self.actions.wait()
+
+        # Everything up to here has now been dealt with, so if the bot stops now this is where it can catch up from: the newest post we've seen, or
+        # if the rate limit has put some requests off, just before the oldest of those (they aren't in the state store yet, so nothing else would find them).
+        # Not while a catch-up is still going, as the posts it hasn't reached yet are older than any of these.
+        if self.newest_created_utc is not None and self.backfill is None:
+            not_asked = [post._submission.created_utc for post in self.submissions
+                         if post not in self.scheduled and not post._submission_statement_checked and self.owns_shard(post)]
+            catch_up_from = min(not_asked) - 1 if len(not_asked) > 0 else self.newest_created_utc
+            self.state.set_meta("newest_created_utc", catch_up_from)
+
+        # Anything that is left on the heap is still waiting on the user, and costs nothing this time around
+        print("  " + str(len(self.scheduled)) + " posts waiting for their time to expire")
             
         print("  Done in " + str(datetime.now(timezone.utc) - self.run_start_time) + ".")
         print(str(self.post_counter) + " posts seen, " + str(self.action_counter) + " actions taken, " + str(self.post_counter - self.action_counter) + " valid posts.")
@@ -448,8 +1713,9 @@ class Janitor:
 def go():
     
     # Init Janitor
-    print("Setting subreddit: "+ cfg['DEFAULT']['subreddit'])
-    jannie = Janitor(cfg['DEFAULT']['subreddit'])
+    subreddit_settings = load_subreddit_settings()
+    print("Setting subreddit(s): "+ ", ".join(settings.subreddit for settings in subreddit_settings.values()))
+    jannie = Janitor(subreddit_settings)
 
     # Process posts - run forever    
     while True:
@@ -465,11 +1731,7 @@ def go():
                 jannie.handle_posts()
                  
                 # Wait (min 30 seconds)
-                wait_time_from_config = int(cfg['DEFAULT']['bot_interval'])
-                if wait_time_from_config > 30:
-                    wait_time = wait_time_from_config
-                else:
-                    wait_time = 30
+                wait_time = jannie.wait_time()
                 print("Waiting " + str(wait_time) +" seconds")
                 time.sleep(wait_time) 
 